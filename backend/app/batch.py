@@ -0,0 +1,180 @@
+"""
+Batch pipeline runner behind POST /api/pipeline/batch.
+
+Patients are resolved and their bundles fetched in chunks (one $in query per
+chunk); CDS for each chunk runs on a shared thread/process pool. At most
+PIPELINE_MAX_IN_FLIGHT chunks are outstanding at once, so memory stays flat
+however many patients are requested. Results stream back as NDJSON lines in
+completion order; per-patient problems are error lines, not a failed batch.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .db import patients_collection, triage_collection
+from .services import bundles_for_mrns, cds_many, mock_cds, critical_alerts
+
+PIPELINE_POOL = os.getenv("PIPELINE_POOL", "thread")  # 'thread' | 'process'
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(min(8, os.cpu_count() or 1))))
+PIPELINE_CHUNK_SIZE = int(os.getenv("PIPELINE_CHUNK_SIZE", "200"))
+PIPELINE_MAX_IN_FLIGHT = int(os.getenv("PIPELINE_MAX_IN_FLIGHT", str(PIPELINE_WORKERS * 2)))
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if PIPELINE_POOL == "process":
+            _executor = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="cds")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def cds_chunk(bundles):
+    """
+    CDS for one chunk (runs in the pool). If the vectorized pass fails on a
+    malformed bundle, fall back to per-bundle evaluation to isolate it.
+    """
+    try:
+        return cds_many(bundles)
+    except Exception:
+        results = []
+        for bundle in bundles:
+            try:
+                results.append(mock_cds(bundle))
+            except Exception as exc:
+                results.append({"error": f"CDS failed: {exc!r}"})
+        return results
+
+
+def _chunks(items, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+_PATIENT_FIELDS = {"_id": 0, "patient_id": 1, "mrn": 1}
+
+
+async def chunks_by_ids(patient_ids, chunk_size: int = PIPELINE_CHUNK_SIZE):
+    """Yield (patients, error lines) per chunk of requested patient IDs."""
+    for ids in _chunks(list(dict.fromkeys(patient_ids)), chunk_size):
+        found = {
+            p["patient_id"]: p
+            async for p in patients_collection().find({"patient_id": {"$in": ids}}, _PATIENT_FIELDS)
+        }
+        errors = [{"patient_id": pid, "error": "No patient found"} for pid in ids if pid not in found]
+        yield [found[pid] for pid in ids if pid in found], errors
+
+
+async def chunks_by_mrns(mrns, chunk_size: int = PIPELINE_CHUNK_SIZE):
+    """Yield (patients, error lines) per chunk of requested MRNs."""
+    for chunk in _chunks(list(dict.fromkeys(mrns)), chunk_size):
+        found = {
+            p["mrn"]: p
+            async for p in patients_collection().find({"mrn": {"$in": chunk}}, _PATIENT_FIELDS)
+        }
+        errors = [{"mrn": mrn, "error": "No patient found"} for mrn in chunk if mrn not in found]
+        yield [found[mrn] for mrn in chunk if mrn in found], errors
+
+
+async def chunks_by_filter(status: str = None, gender: str = None, chunk_size: int = PIPELINE_CHUNK_SIZE):
+    """
+    Yield patient chunks matching the filter, paging on patient_id. A status
+    alone is served straight from the triage store; combined with patient
+    fields it is applied per chunk.
+    """
+    from_triage = gender is None and status is not None
+    if from_triage:
+        source, query = triage_collection(), {"status": status}
+    else:
+        source, query = patients_collection(), ({"gender": gender} if gender is not None else {})
+
+    last = None
+    while True:
+        page_query = dict(query)
+        if last is not None:
+            page_query["patient_id"] = {"$gt": last}
+        patients = await (
+            source.find(page_query, _PATIENT_FIELDS).sort("patient_id", 1).limit(chunk_size).to_list(None)
+        )
+        if not patients:
+            return
+        last = patients[-1]["patient_id"]
+        if status is not None and not from_triage:
+            matching = {
+                d["patient_id"]
+                async for d in triage_collection().find(
+                    {"patient_id": {"$in": [p["patient_id"] for p in patients]}, "status": status},
+                    {"_id": 0, "patient_id": 1},
+                )
+            }
+            patients = [p for p in patients if p["patient_id"] in matching]
+        yield patients, []
+
+
+async def _process_chunk(patients, errors, include_bundle: bool):
+    """Fetch bundles for one chunk, run CDS on the pool, return result lines."""
+    lines = list(errors)
+    bundles = await bundles_for_mrns(p["mrn"] for p in patients)
+    ready = []
+    for p in patients:
+        if p["mrn"] in bundles:
+            ready.append(p)
+        else:
+            lines.append({"patient_id": p["patient_id"], "mrn": p["mrn"], "error": "No bundle found"})
+    if not ready:
+        return lines
+
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(get_executor(), cds_chunk, [bundles[p["mrn"]] for p in ready])
+    for p, cds in zip(ready, results):
+        line = {"patient_id": p["patient_id"], "mrn": p["mrn"]}
+        if "error" in cds:
+            line["error"] = cds["error"]
+        else:
+            alerts = cds.get("alerts", [])
+            line["status"] = "critical" if critical_alerts(alerts) else "normal"
+            line["alerts"] = alerts
+            if include_bundle:
+                line["bundle"] = bundles[p["mrn"]]
+        lines.append(line)
+    return lines
+
+
+async def stream_batch(chunks, include_bundle: bool = False, max_in_flight: int = PIPELINE_MAX_IN_FLIGHT):
+    """
+    Async generator of NDJSON lines. New chunks are only pulled from `chunks`
+    while fewer than `max_in_flight` are being processed (backpressure).
+    """
+    pending = set()
+
+    async def drain():
+        nonlocal pending
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            for line in task.result():
+                yield json.dumps(line, default=str) + "\n"
+
+    try:
+        async for patients, errors in chunks:
+            pending.add(asyncio.ensure_future(_process_chunk(patients, errors, include_bundle)))
+            while len(pending) >= max_in_flight:
+                async for line in drain():
+                    yield line
+        while pending:
+            async for line in drain():
+                yield line
+    finally:
+        # Client went away or a chunk failed: don't leave work running
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,105 @@
+"""
+In-process caches for values that are expensive to recompute per request.
+"""
+import os
+import time
+from collections import OrderedDict
+
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+BUNDLE_CACHE_SIZE = int(os.getenv("BUNDLE_CACHE_SIZE", "1024"))
+BUNDLE_CACHE_TTL = float(os.getenv("BUNDLE_CACHE_TTL", "300"))
+
+
+class CountCache:
+    """
+    Caches totals for `ttl` seconds. Writers call invalidate() so lists show
+    fresh totals right after seeding/triage changes without counting per request.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._values = {}
+
+    async def get(self, key, loader):
+        now = time.monotonic()
+        hit = self._values.get(key)
+        if hit is not None and now - hit[1] < self.ttl:
+            return hit[0]
+        value = await loader()
+        self._values[key] = (value, now)
+        return value
+
+    def invalidate(self, *keys):
+        if not keys:
+            self._values.clear()
+        for key in keys:
+            self._values.pop(key, None)
+
+
+counts = CountCache(COUNT_CACHE_TTL)
+
+
+class LRUCache:
+    """
+    Bounded LRU cache with a per-entry TTL. Each entry is stored with a
+    version (e.g. a content hash); get() for any other version is a miss,
+    so a changed bundle is never served even before it is invalidated.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, value, stored_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry[2] >= self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, value):
+        self._entries[key] = (version, value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        if not keys:
+            self._entries.clear()
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# mrn -> (bundle, cds), versioned by the triage doc's bundle_hash + alerts (routes.pipeline_state)
+bundle_cache = LRUCache(BUNDLE_CACHE_SIZE, BUNDLE_CACHE_TTL)
+# mrn -> /pipeline/simple payload, same versioning
+summary_cache = LRUCache(BUNDLE_CACHE_SIZE, BUNDLE_CACHE_TTL)
+
+
+def invalidate_bundles(*mrns):
+    """Write hook: drop cached bundles/CDS/summaries for these MRNs (all if none given)."""
+    bundle_cache.invalidate(*mrns)
+    summary_cache.invalidate(*mrns)
@@ -0,0 +1,232 @@
+"""
+Table-driven CDS rules.
+
+Each rule names the resource it applies to (resourceType + code text, and
+optionally a component code text), how to pull its values out, a threshold
+test and an alert template. Rules are compiled into a dispatch index keyed by
+(resourceType, code text) so an entry is only tested against rules that can
+apply to it. Add a rule by appending to RULES.
+
+`evaluate()` runs one bundle; `evaluate_many()` collects values for a whole
+cohort into NumPy columns and applies each rule's test once per column.
+Both return alerts in bundle/entry/component/rule order.
+"""
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+
+_NO_CODE = {}
+
+
+class Rule(NamedTuple):
+    resource_type: str
+    code: Optional[str]        # code.text to dispatch on; None = any code
+    component: Optional[str]   # test each component with this code.text instead of the resource
+    extract: Callable          # resource/component -> tuple of values
+    test: Callable             # *values -> bool; must also work on NumPy columns
+    message: str               # str.format template over the extracted values
+    dtype: type = float
+
+
+def _number(value):
+    # NumPy would quietly turn "31" into 31.0 and None into NaN; reject them the
+    # way a scalar comparison does so evaluate() and evaluate_many() agree
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"CDS value must be a number, got {value!r}")
+    return value
+
+
+def _value(res):
+    return (_number(res["valueQuantity"]["value"]),)
+
+
+def _blood_pressure(res):
+    return (
+        _number(res["component"][0]["valueQuantity"]["value"]),
+        _number(res["component"][1]["valueQuantity"]["value"]),
+    )
+
+
+def _condition_text(res):
+    return (res["code"]["text"].lower(),)
+
+
+def _contains(keyword):
+    def test(text):
+        if isinstance(text, str):
+            return keyword in text
+        return np.char.find(text, keyword) >= 0
+    return test
+
+
+RULES = (
+    # 🔹 Lab: Lipid panel
+    Rule("Observation", "Lipid panel", "LDL", _value, lambda v: v >= 160,
+         "High LDL cholesterol: consider statin"),
+    Rule("Observation", "Lipid panel", "HDL", _value, lambda v: v < 40,
+         "Low HDL cholesterol: lifestyle modification advised"),
+    # 🔹 Vitals: Blood pressure
+    Rule("Observation", "Blood pressure", None, _blood_pressure,
+         lambda systolic, diastolic: (systolic >= 140) | (diastolic >= 90),
+         "Hypertension detected ({0}/{1} mmHg)"),
+    # 🔹 Vitals: BMI
+    Rule("Observation", "Body mass index", None, _value, lambda bmi: bmi >= 30,
+         "Obesity (BMI {0}): recommend weight management"),
+    Rule("Observation", "Body mass index", None, _value, lambda bmi: bmi < 18.5,
+         "Underweight (BMI {0}): evaluate nutrition"),
+    # 🔹 Lab: HbA1c
+    Rule("Observation", "HbA1c", None, _value, lambda v: v >= 6.5,
+         "Diabetes control issue (HbA1c {0}%)"),
+    # 🔹 Lab: Creatinine (renal function)
+    Rule("Observation", "Creatinine", None, _value, lambda v: v >= 1.5,
+         "Elevated creatinine ({0} mg/dL): check renal function"),
+    # 🔹 Condition-based alerts
+    Rule("Condition", None, None, _condition_text, _contains("heart failure"),
+         "Heart failure: monitor fluid status", str),
+    Rule("Condition", None, None, _condition_text, _contains("copd"),
+         "COPD: ensure inhaler adherence", str),
+    Rule("Condition", None, None, _condition_text, _contains("hypertension"),
+         "Hypertension: consider tighter BP control", str),
+    Rule("Condition", None, None, _condition_text, _contains("diabetes"),
+         "Diabetes: monitor HbA1c and glucose levels", str),
+)
+
+
+class RuleIndex:
+    """Rules compiled into a (resourceType, code text) dispatch table."""
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        whole, by_component = {}, {}
+        for i, rule in enumerate(self.rules):
+            key = (rule.resource_type, rule.code)
+            if rule.component is None:
+                whole.setdefault(key, []).append(i)
+            else:
+                by_component.setdefault(key, {}).setdefault(rule.component, []).append(i)
+
+        # key -> (groups for the resource, {component code text: groups})
+        self._index = {
+            key: (
+                self._group(whole.get(key, [])),
+                {comp: self._group(ids) for comp, ids in by_component.get(key, {}).items()},
+            )
+            for key in set(whole) | set(by_component)
+        }
+
+    def _group(self, rule_ids):
+        """Merge consecutive rules sharing an extractor so values are pulled once."""
+        groups = []
+        for i in rule_ids:
+            extract = self.rules[i].extract
+            if groups and groups[-1][0] is extract:
+                groups[-1][1].append(i)
+            else:
+                groups.append((extract, [i]))
+        return groups
+
+    @property
+    def resource_types(self):
+        """Resource types any rule reads (for projected bundle fetches)."""
+        return {rule.resource_type for rule in self.rules}
+
+    def lookup(self, res):
+        """Compiled rules that apply to `res` (code-specific first), or ()."""
+        return self.lookup_key(res["resourceType"], res.get("code", _NO_CODE).get("text"))
+
+    def lookup_key(self, resource_type, code):
+        specific = self._index.get((resource_type, code))
+        generic = self._index.get((resource_type, None)) if code is not None else None
+        if specific is None:
+            return (generic,) if generic is not None else ()
+        return (specific, generic) if generic is not None else (specific,)
+
+    @staticmethod
+    def targets(res, compiled):
+        """
+        Yield (target, extract, rule ids) for `res` and its compiled rules:
+        the resource itself first, then matching components in order.
+        """
+        for whole, by_component in compiled:
+            for extract, ids in whole:
+                yield res, extract, ids
+            if by_component:
+                for comp in res.get("component", []):
+                    for extract, ids in by_component.get(comp["code"]["text"], ()):
+                        yield comp, extract, ids
+
+    def evaluate(self, bundle):
+        """Alerts for a single bundle."""
+        keyed = (
+            ((res["resourceType"], res.get("code", _NO_CODE).get("text")), res)
+            for res in (entry["resource"] for entry in bundle["entry"])
+        )
+        return self._evaluate_keyed(keyed)
+
+    def evaluate_view(self, view):
+        """Alerts for a fhir_utils.BundleView, reusing its precomputed keys."""
+        return self._evaluate_keyed(zip(view.keys, view.resources))
+
+    def _evaluate_keyed(self, keyed):
+        rules = self.rules
+        alerts = []
+        for (resource_type, code), res in keyed:
+            compiled = self.lookup_key(resource_type, code)
+            if not compiled:
+                continue
+            for target, extract, ids in self.targets(res, compiled):
+                values = extract(target)
+                for i in ids:
+                    rule = rules[i]
+                    if rule.test(*values):
+                        alerts.append(rule.message.format(*values))
+        return alerts
+
+    def evaluate_many(self, bundles):
+        """
+        Alerts for many bundles at once. Values are gathered per rule into
+        columnar arrays so every threshold is applied in one vectorized pass;
+        a running sequence number restores the single-bundle alert order.
+        """
+        seqs = [[] for _ in self.rules]
+        owners = [[] for _ in self.rules]
+        values = [[] for _ in self.rules]
+        seq = 0
+        for b, bundle in enumerate(bundles):
+            for entry in bundle["entry"]:
+                res = entry["resource"]
+                compiled = self.lookup(res)
+                if not compiled:
+                    continue
+                for target, extract, ids in self.targets(res, compiled):
+                    extracted = extract(target)
+                    for i in ids:
+                        seqs[i].append(seq)
+                        owners[i].append(b)
+                        values[i].append(extracted)
+                        seq += 1
+
+        hit_seqs, hit_owners, messages = [], [], []
+        for i, rule in enumerate(self.rules):
+            if not seqs[i]:
+                continue
+            columns = [np.asarray(col, dtype=rule.dtype) for col in zip(*values[i])]
+            hits = np.flatnonzero(np.asarray(rule.test(*columns), dtype=bool))
+            if not hits.size:
+                continue
+            hit_seqs.append(np.asarray(seqs[i])[hits])
+            hit_owners.append(np.asarray(owners[i])[hits])
+            # Format from the original values so numbers print exactly as stored
+            messages.extend(rule.message.format(*values[i][j]) for j in hits)
+
+        alerts = [[] for _ in bundles]
+        if messages:
+            order = np.argsort(np.concatenate(hit_seqs), kind="stable")
+            owner = np.concatenate(hit_owners)
+            for j in order:
+                alerts[owner[j]].append(messages[j])
+        return alerts
+
+
+default_rules = RuleIndex(RULES)
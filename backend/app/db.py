@@ -1,9 +1,69 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 import os
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017/")
-client = MongoClient(MONGO_URI)
-db = client["triage_db"]
+MONGO_DB = os.getenv("MONGO_DB", "triage_db")
 
-patients_collection = db["patients"]
-fhir_collection = db["fhir_bundles"]
+# Connection pool / timeout tuning (pymongo defaults when unset)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = os.getenv("MONGO_MAX_IDLE_TIME_MS")
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_SOCKET_TIMEOUT_MS = os.getenv("MONGO_SOCKET_TIMEOUT_MS")
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+client = None
+
+
+def _optional_int(value):
+    return int(value) if value else None
+
+
+def connect(**kwargs):
+    """Open the shared async client (idempotent). Extra kwargs go to AsyncMongoClient."""
+    global client
+    if client is None:
+        client = AsyncMongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=_optional_int(MONGO_MAX_IDLE_TIME_MS),
+            waitQueueTimeoutMS=_optional_int(MONGO_WAIT_QUEUE_TIMEOUT_MS),
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=_optional_int(MONGO_SOCKET_TIMEOUT_MS),
+            readPreference=MONGO_READ_PREFERENCE,
+            **kwargs,
+        )
+    return client
+
+
+async def close():
+    global client
+    if client is not None:
+        await client.close()
+        client = None
+
+
+def get_db():
+    if client is None:
+        raise RuntimeError("Mongo client is not connected; call app.db.connect() first")
+    return client[MONGO_DB]
+
+
+def patients_collection():
+    return get_db()["patients"]
+
+
+def fhir_collection():
+    return get_db()["fhir_bundles"]
+
+
+def triage_collection():
+    return get_db()["triage_status"]
+
+
+def ingest_collection():
+    return get_db()["ingest_jobs"]
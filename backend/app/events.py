@@ -0,0 +1,197 @@
+"""
+Live triage updates over server-sent events (GET /api/triage/stream).
+
+The triage store publishes to one in-process `TriageBroadcaster` when a
+patient's status actually changes; every connected dashboard gets the same
+event from its own bounded queue, so nothing is recomputed per client.
+
+A client first receives a `snapshot` (cohort totals), then `status` deltas:
+
+    {seq, patient_id, mrn, status, previous, alerts}
+
+Event ids are "<epoch>-<seq>". On reconnect EventSource sends the last id back
+(Last-Event-ID); missed deltas are replayed from a ring buffer, or a fresh
+snapshot is sent when they have been dropped, the server restarted, or the
+client fell too far behind. Idle streams get a comment line as heartbeat.
+
+Totals are counted once and then kept current from the deltas. Deltas only
+cover changes made in this process, so writes from other processes (the
+seed/triage/ingest CLIs) are caught by recounting once the totals are older
+than SSE_TOTALS_TTL seconds; a recount that disagrees resyncs every client.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from .db import patients_collection, triage_collection
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+SSE_HISTORY = int(os.getenv("SSE_HISTORY", "1000"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "256"))
+SSE_TOTALS_TTL = float(os.getenv("SSE_TOTALS_TTL", "60"))
+
+
+class _Subscriber:
+    __slots__ = ("queue",)
+
+    def __init__(self, maxsize: int):
+        # Items are (seq, event, data); None means "resend a snapshot"
+        self.queue = asyncio.Queue(maxsize)
+
+
+class TriageBroadcaster:
+    def __init__(
+        self,
+        history: int = SSE_HISTORY,
+        queue_size: int = SSE_QUEUE_SIZE,
+        totals_ttl: float = SSE_TOTALS_TTL,
+    ):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.seq = 0
+        self.queue_size = queue_size
+        self.totals_ttl = totals_ttl
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._totals = None  # {"total", "critical"} as of self.seq
+        self._totals_at = 0.0  # monotonic time of the last count
+        self._totals_lock = asyncio.Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish_status(self, doc: dict, previous):
+        """Publish one triage doc if its status differs from `previous` (None = no doc yet, shown as normal)."""
+        if doc["status"] == (previous or "normal"):
+            return
+        if self._totals is not None:
+            self._totals["critical"] += (doc["status"] == "critical") - (previous == "critical")
+        self._publish("status", {
+            "patient_id": doc["patient_id"],
+            "mrn": doc.get("mrn"),
+            "status": doc["status"],
+            "previous": previous,
+            "alerts": doc.get("alerts", []),
+        })
+
+    def resync(self, totals: dict = None):
+        """
+        Bulk change (rebuild, patients seeded): drop the totals and history and
+        send every client a fresh snapshot instead of a flood of deltas.
+        `totals` are fresh counts to snapshot from, if the caller has them.
+        """
+        self._totals = totals
+        self._history.clear()
+        self.seq += 1
+        for sub in self._subscribers:
+            self._offer(sub, None)
+
+    def _publish(self, event: str, data: dict):
+        self.seq += 1
+        item = (self.seq, event, {"seq": self.seq, **data})
+        self._history.append(item)
+        for sub in self._subscribers:
+            self._offer(sub, item)
+
+    @staticmethod
+    def _offer(sub: _Subscriber, item):
+        try:
+            sub.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Slow client: drop its backlog and resync it with a snapshot
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+
+    def _totals_stale(self) -> bool:
+        return self._totals is None or time.monotonic() - self._totals_at >= self.totals_ttl
+
+    async def _count(self) -> dict:
+        while True:
+            seq = self.seq
+            total = await patients_collection().estimated_document_count()
+            critical = await triage_collection().count_documents({"status": "critical"})
+            # Retry if a change landed mid-count, so totals match `seq` exactly
+            if seq == self.seq:
+                self._totals_at = time.monotonic()
+                return {"total": total, "critical": critical}
+
+    async def snapshot(self) -> dict:
+        """Current totals; counted from Mongo when unknown or older than the TTL."""
+        async with self._totals_lock:
+            if self._totals_stale():
+                self._totals = await self._count()
+        total, critical = self._totals["total"], self._totals["critical"]
+        return {"seq": self.seq, "total": total, "critical": critical, "normal": total - critical}
+
+    async def recount(self):
+        """
+        Re-count stale totals and resync every client if they drifted (writes
+        from other processes never reach publish_status). Returns True on resync.
+        """
+        async with self._totals_lock:
+            if self._totals is None or not self._totals_stale():
+                return False
+            totals = await self._count()
+            if totals == self._totals:
+                return False
+            self.resync(totals)
+            return True
+
+    def _replay(self, last_event_id):
+        """Events after `last_event_id`, or None when they can't all be replayed."""
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self.seq:
+            return None
+        oldest = self._history[0][0] if self._history else self.seq + 1
+        if seq < oldest - 1:
+            return None
+        return [item for item in self._history if item[0] > seq]
+
+    def _format(self, seq: int, event: str, data: dict) -> str:
+        return f"id: {self.epoch}-{seq}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    async def stream(self, last_event_id: str = None):
+        """Async generator of SSE messages for one client."""
+        sub = _Subscriber(self.queue_size)
+        self._subscribers.add(sub)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            replay = self._replay(last_event_id)
+            if replay is None:
+                snapshot = await self.snapshot()
+                sent = snapshot["seq"]
+                yield self._format(sent, "snapshot", snapshot)
+            else:
+                sent = self.seq
+                for item in replay:
+                    yield self._format(*item)
+
+            while True:
+                if self._totals_stale():
+                    await self.recount()
+                try:
+                    item = await asyncio.wait_for(sub.queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if item is None:
+                    snapshot = await self.snapshot()
+                    sent = snapshot["seq"]
+                    yield self._format(sent, "snapshot", snapshot)
+                elif item[0] > sent:  # already covered by the snapshot otherwise
+                    sent = item[0]
+                    yield self._format(*item)
+        finally:
+            self._subscribers.discard(sub)
+
+
+broadcaster = TriageBroadcaster()
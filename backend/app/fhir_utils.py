@@ -0,0 +1,180 @@
+"""
+Single-pass FHIR bundle access.
+
+`BundleView` indexes a bundle's entries once by resourceType and by
+(resourceType, code text); consumers (the summary view, CDS) read from the
+index instead of re-scanning `bundle["entry"]`. Extracted fields are returned
+as small __slots__ records.
+
+`bundle_projection()` builds a Mongo projection that only returns entries of
+the resource types (and Observation codes) an endpoint needs.
+
+`observation()` / `components()` build Observation resources in the shape the
+view and the CDS rules read (synthetic cohorts, parsed documents).
+"""
+
+
+class PatientInfo:
+    __slots__ = ("name", "gender", "birth_date")
+
+    def __init__(self, name, gender, birth_date):
+        self.name = name
+        self.gender = gender
+        self.birth_date = birth_date
+
+
+class ConditionRecord:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class MedicationRecord:
+    __slots__ = ("medication", "instructions")
+
+    def __init__(self, medication, instructions):
+        self.medication = medication
+        self.instructions = instructions
+
+
+class BloodPressure:
+    __slots__ = ("systolic", "diastolic")
+
+    def __init__(self, systolic, diastolic):
+        self.systolic = systolic
+        self.diastolic = diastolic
+
+
+class Quantity:
+    __slots__ = ("value", "unit")
+
+    def __init__(self, value, unit):
+        self.value = value
+        self.unit = unit
+
+
+def code_text(res):
+    code = res.get("code")
+    return code.get("text") if code else None
+
+
+class BundleView:
+    """Read-only view over a FHIR bundle, indexed in one pass."""
+
+    __slots__ = ("bundle", "resources", "keys", "_by_type", "_by_code")
+
+    def __init__(self, bundle: dict):
+        self.bundle = bundle
+        self.resources = [e["resource"] for e in bundle.get("entry") or []]
+        # (resourceType, code text) per resource, in bundle order
+        self.keys = []
+        self._by_type = {}
+        self._by_code = {}
+        for res in self.resources:
+            key = (res["resourceType"], code_text(res))
+            self.keys.append(key)
+            self._by_type.setdefault(key[0], []).append(res)
+            if key[1] is not None:
+                self._by_code.setdefault(key, []).append(res)
+
+    def of_type(self, resource_type: str) -> list:
+        return self._by_type.get(resource_type, [])
+
+    def with_code(self, resource_type: str, text: str) -> list:
+        return self._by_code.get((resource_type, text), [])
+
+    def _last_observation(self, text: str):
+        # Later observations win, matching a straight scan of the bundle
+        found = self.with_code("Observation", text)
+        return found[-1] if found else None
+
+    @property
+    def patient(self):
+        patients = self.of_type("Patient")
+        if not patients:
+            return None
+        res = patients[0]
+        name = res["name"][0]
+        return PatientInfo(f"{name['given'][0]} {name['family']}", res.get("gender"), res.get("birthDate"))
+
+    @property
+    def conditions(self):
+        return [ConditionRecord(res["code"]["text"]) for res in self.of_type("Condition")]
+
+    @property
+    def medications(self):
+        return [
+            MedicationRecord(
+                res["medicationCodeableConcept"]["text"],
+                res["dosageInstruction"][0]["text"],
+            )
+            for res in self.of_type("MedicationRequest")
+        ]
+
+    @property
+    def blood_pressure(self):
+        res = self._last_observation("Blood pressure")
+        if res is None:
+            return None
+        return BloodPressure(
+            res["component"][0]["valueQuantity"]["value"],
+            res["component"][1]["valueQuantity"]["value"],
+        )
+
+    @property
+    def bmi(self):
+        return self.quantity("Body mass index")
+
+    def quantity(self, text: str):
+        """valueQuantity of the last Observation with this code text (labs, BMI)."""
+        res = self._last_observation(text)
+        if res is None:
+            return None
+        return Quantity(res["valueQuantity"]["value"], res["valueQuantity"].get("unit"))
+
+
+def bundle_projection(resource_types=None, observation_codes=None) -> dict:
+    """
+    find() projection for a bundle. With `resource_types`, entries are filtered
+    server-side so only those resources are transferred and decoded;
+    `observation_codes` additionally keeps Observations with those code texts.
+    """
+    if not resource_types and not observation_codes:
+        return {"_id": 0}
+    cond = {"$in": ["$$e.resource.resourceType", sorted(resource_types or ())]}
+    if observation_codes:
+        cond = {"$or": [cond, {"$and": [
+            {"$eq": ["$$e.resource.resourceType", "Observation"]},
+            {"$in": ["$$e.resource.code.text", sorted(observation_codes)]},
+        ]}]}
+    return {
+        "_id": 0,
+        "resourceType": 1,
+        "type": 1,
+        "mrn": 1,
+        "entry": {"$filter": {"input": "$entry", "as": "e", "cond": cond}},
+    }
+
+
+def observation(text: str, value, unit: str) -> dict:
+    """Single-valued Observation, e.g. observation("HbA1c", 7.1, "%")."""
+    return {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"text": text},
+        "valueQuantity": {"value": value, "unit": unit},
+    }
+
+
+def components(text: str, parts) -> dict:
+    """Observation with (name, value, unit) components (blood pressure, lipid panel)."""
+    return {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"text": text},
+        "component": [
+            {"code": {"text": name}, "valueQuantity": {"value": value, "unit": unit}}
+            for name, value, unit in parts
+        ],
+    }
@@ -0,0 +1,361 @@
+"""
+Asynchronous ingestion queue behind POST /api/ingest.
+
+Jobs are documents in `ingest_jobs`:
+
+    {job_id, kind: 'bundle' | 'document', mrn, payload,
+     status: 'queued' | 'running' | 'done' | 'failed', attempts, max_attempts,
+     available_at, lease_expires_at, worker, error, result, created_at, updated_at}
+
+Workers (INGEST_WORKERS asyncio tasks started with the app, or a standalone
+`python -m app.ingest`) each claim up to INGEST_BATCH_SIZE due jobs with an
+atomic find_one_and_update that sets a lease. A batch goes through the parse
+stage (app.stages, concurrently across MRNs), CDS on the shared pool in one
+vectorized pass, a bulk upsert of the bundles by mrn and the triage store
+write, which also invalidates caches and pushes live updates. Read endpoints
+then serve the stored alerts instead of running the pipeline. Bundle jobs
+replace the patient's stored bundle; document jobs add their resources to it.
+
+Jobs that can never succeed (unknown MRN, a malformed bundle, a parse or CDS
+error on the payload) fail at once. Other failures are retried with
+exponential backoff until INGEST_MAX_ATTEMPTS; a job whose worker died
+mid-batch is claimed again once its lease expires. Live updates only reach
+dashboards connected to the process running the workers.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pydantic import ValidationError
+from pymongo import ASCENDING, ReplaceOne, ReturnDocument, UpdateOne
+
+from . import db
+from .batch import cds_chunk, get_executor
+from .cache import invalidate_bundles
+from .db import fhir_collection, ingest_collection, patients_collection
+from .models import FHIRBundle
+from .services import bundles_for_mrns, critical_alerts
+from .stages import load_stage
+from .triage import bundle_hash, compute_triage_doc, refresh_triage_for_mrns, write_triage_docs
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "20"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "60"))
+INGEST_RETRY_SECONDS = float(os.getenv("INGEST_RETRY_SECONDS", "5"))
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "2"))
+
+# What GET /api/ingest/{job_id} returns
+JOB_FIELDS = {"_id": 0, "payload": 0}
+
+# Parse errors that retrying the same payload can't fix
+DETERMINISTIC_ERRORS = (ValueError, KeyError, TypeError, IndexError)
+
+logger = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+async def ensure_ingest_indexes():
+    await ingest_collection().create_index([("job_id", ASCENDING)], unique=True)
+    await ingest_collection().create_index([("status", ASCENDING), ("available_at", ASCENDING)])
+    await ingest_collection().create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+
+
+async def enqueue(kind: str, mrn: str, payload: dict, max_attempts: int = INGEST_MAX_ATTEMPTS) -> dict:
+    """Queue one bundle or document for the workers; returns the job (without payload)."""
+    now = _now()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "kind": kind,
+        "mrn": mrn,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "available_at": now,
+        "lease_expires_at": None,
+        "worker": None,
+        "error": None,
+        "result": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await ingest_collection().insert_one(dict(job))
+    workers.wake()
+    return {k: v for k, v in job.items() if k != "payload"}
+
+
+async def get_job(job_id: str):
+    return await ingest_collection().find_one({"job_id": job_id}, JOB_FIELDS)
+
+
+async def claim_job(worker: str):
+    """Atomically lease the oldest due job (or one whose lease ran out)."""
+    now = _now()
+    return await ingest_collection().find_one_and_update(
+        {"$or": [
+            {"status": "queued", "available_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lte": now}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "worker": worker,
+                "lease_expires_at": now + timedelta(seconds=INGEST_LEASE_SECONDS),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", ASCENDING)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def claim_batch(worker: str, batch_size: int = INGEST_BATCH_SIZE):
+    jobs = []
+    while len(jobs) < batch_size:
+        job = await claim_job(worker)
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+async def _finish(job: dict, update: dict):
+    # Guarded on the worker so a job re-claimed after its lease expired isn't overwritten
+    update.update({"lease_expires_at": None, "updated_at": _now()})
+    await ingest_collection().update_one({"job_id": job["job_id"], "worker": job["worker"]}, {"$set": update})
+
+
+async def _fail(job: dict, error: str):
+    logger.warning("ingest job %s failed after %d attempts: %s", job["job_id"], job["attempts"], error)
+    await _finish(job, {"status": "failed", "error": error})
+
+
+async def _retry_or_fail(job: dict, error: str):
+    if job["attempts"] >= job["max_attempts"]:
+        await _fail(job, error)
+        return
+    delay = INGEST_RETRY_SECONDS * 2 ** (job["attempts"] - 1)
+    await _finish(job, {
+        "status": "queued",
+        "error": error,
+        "worker": None,
+        "available_at": _now() + timedelta(seconds=delay),
+    })
+
+
+async def _parse_chain(stage, jobs, patient: dict, existing):
+    """
+    Parse one MRN's jobs in order, passing each the bundle left by the one
+    before. Returns [(job, bundle, None) | (job, None, (error, retryable))].
+    """
+    results = []
+    for job in jobs:
+        try:
+            bundle = await stage.parse(job, patient, existing)
+            FHIRBundle.model_validate(bundle)
+        except ValidationError as exc:
+            error = (f"Invalid bundle: {exc.errors(include_url=False, include_input=False)}", False)
+        except Exception as exc:
+            error = (f"Parse failed: {exc!r}", not isinstance(exc, DETERMINISTIC_ERRORS))
+        else:
+            results.append((job, bundle, None))
+            existing = bundle
+            continue
+        results.append((job, None, error))
+    return results
+
+
+def _merge_op(mrn: str, base, bundle: dict):
+    """
+    Write for a document merge: $push only the entries added on top of the
+    stored bundle `base`, so concurrent merges for one patient both land.
+    None when `bundle` doesn't extend `base` (the stage rewrote it).
+    """
+    base_entries = (base or {}).get("entry") or []
+    if bundle["entry"][:len(base_entries)] != base_entries:
+        return None
+    fields = {k: v for k, v in bundle.items() if k not in ("_id", "mrn", "entry")}
+    return UpdateOne(
+        {"mrn": mrn},
+        {"$push": {"entry": {"$each": bundle["entry"][len(base_entries):]}}, "$set": fields},
+        upsert=True,
+    )
+
+
+async def process_batch(jobs, stage, worker: str):
+    """Parse -> CDS -> persist bundles -> triage store for one claimed batch."""
+    live = []
+    for job in jobs:
+        if job["attempts"] > job["max_attempts"]:
+            # Only reachable when leases kept expiring (worker crashes/timeouts)
+            await _finish(job, {"status": "failed", "error": job.get("error") or "Lease expired"})
+        else:
+            live.append(job)
+    if not live:
+        return
+
+    patients = {
+        p["mrn"]: p
+        async for p in patients_collection().find({"mrn": {"$in": [j["mrn"] for j in live]}}, {"_id": 0})
+    }
+    known = []
+    for job in live:
+        if job["mrn"] in patients:
+            known.append(job)
+        else:
+            # Checked at enqueue too; the patient may have been removed since
+            await _fail(job, f"No patient with mrn {job['mrn']!r}")
+    if not known:
+        return
+
+    # Documents merge into the stored bundle, so they need it (one $in query)
+    stored = await bundles_for_mrns({job["mrn"] for job in known if job["kind"] == "document"})
+    by_mrn = {}
+    for job in known:
+        by_mrn.setdefault(job["mrn"], []).append(job)
+    # MRNs parse concurrently; one MRN's jobs run in queue order, each on top of the last
+    parsed = await asyncio.gather(*(
+        _parse_chain(stage, jobs, patients[mrn], stored.get(mrn)) for mrn, jobs in by_mrn.items()
+    ))
+    ready = []
+    for job, bundle, error in (item for chain in parsed for item in chain):
+        if error is None:
+            ready.append((job, bundle))
+        elif error[1]:
+            await _retry_or_fail(job, error[0])
+        else:
+            await _fail(job, error[0])
+    if not ready:
+        return
+
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(get_executor(), cds_chunk, [bundle for _, bundle in ready])
+    done = []
+    for (job, bundle), cds in zip(ready, results):
+        if "error" in cds:
+            # CDS is a pure function of the bundle: a retry would fail the same way
+            await _fail(job, cds["error"])
+        else:
+            done.append((job, bundle, cds["alerts"]))
+    if not done:
+        return
+
+    # Several jobs for one MRN in a batch: the last one holds all of them
+    latest, replaced = {}, set()
+    for job, bundle, alerts in done:
+        latest[job["mrn"]] = (bundle, alerts)
+        if job["kind"] == "bundle":
+            replaced.add(job["mrn"])
+    ops, merged = [], []
+    for mrn, (bundle, _) in latest.items():
+        op = None if mrn in replaced else _merge_op(mrn, stored.get(mrn), bundle)
+        if op is None:
+            ops.append(ReplaceOne({"mrn": mrn}, dict(bundle), upsert=True))
+        else:
+            ops.append(op)
+            merged.append(mrn)
+    try:
+        await fhir_collection().bulk_write(ops, ordered=False)
+        invalidate_bundles(*latest)
+        await write_triage_docs([
+            compute_triage_doc(patients[mrn], bundle, alerts)
+            for mrn, (bundle, alerts) in latest.items()
+            if mrn not in merged
+        ])
+        if merged:
+            # Another worker may have appended to the same bundle meanwhile:
+            # triage what is stored, not what this batch saw
+            await refresh_triage_for_mrns(merged)
+    except Exception as exc:
+        for job, _, _ in done:
+            await _retry_or_fail(job, f"Persist failed: {exc!r}")
+        return
+
+    for job, bundle, alerts in done:
+        await _finish(job, {
+            "status": "done",
+            "error": None,
+            "result": {
+                "patient_id": patients[job["mrn"]]["patient_id"],
+                "status": "critical" if critical_alerts(alerts) else "normal",
+                "alerts": alerts,
+                "bundle_hash": bundle_hash(bundle),
+                "parse_stage": stage.name,
+            },
+        })
+
+
+class IngestWorkers:
+    """The pool of asyncio worker tasks for this process."""
+
+    def __init__(self, count: int = INGEST_WORKERS, batch_size: int = INGEST_BATCH_SIZE):
+        self.count = count
+        self.batch_size = batch_size
+        self.stage = None
+        self._tasks = []
+        self._wakeup = None
+
+    async def start(self):
+        if self._tasks or self.count <= 0:
+            return
+        self.stage = load_stage()
+        self._wakeup = asyncio.Event()
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks = [asyncio.create_task(self._run(f"{prefix}-{i}")) for i in range(self.count)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        """Called on enqueue so idle workers don't wait for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self, name: str):
+        while True:
+            self._wakeup.clear()
+            try:
+                jobs = await claim_batch(name, self.batch_size)
+                if jobs:
+                    await process_batch(jobs, self.stage, name)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # e.g. Mongo unavailable; leased jobs are picked up again after their lease
+                logger.exception("ingest worker %s failed", name)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), INGEST_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+workers = IngestWorkers()
+
+
+async def _main():
+    logging.basicConfig(level=logging.INFO)
+    db.connect()
+    try:
+        await ensure_ingest_indexes()
+        await workers.start()
+        await asyncio.Event().wait()
+    finally:
+        await workers.stop()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
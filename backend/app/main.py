@@ -1,20 +1,52 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from app import db
+from app.batch import shutdown_executor
+from app.ingest import workers as ingest_workers
+from app.metrics import TimingMiddleware, command_listener, render_metrics
 from app.routes import router as api_router
-from app.seed_data import seed_patients, seed_fhir
+from app.seed_data import SEED_ON_STARTUP, ensure_indexes, seed_patients, seed_fhir
+from app.triage import sync_triage_status
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.connect(event_listeners=[command_listener])
+    try:
+        await ensure_indexes()
+        if SEED_ON_STARTUP:
+            await seed_patients()
+            await seed_fhir()
+        # Catch up bundles stored before the triage store existed (or by other
+        # tools); unchanged bundles are skipped by hash, so this is cheap
+        await sync_triage_status()
+        await ingest_workers.start()
+        yield
+    finally:
+        await ingest_workers.stop()
+        shutdown_executor()
+        await db.close()
+
 
-app = FastAPI(title="Mock Triage Pipeline API", version="0.1")
+app = FastAPI(title="Mock Triage Pipeline API", version="0.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
-
-@app.on_event("startup")
-def startup_event():
-    seed_patients()
-    seed_fhir()
+# Outermost, so its timings cover CORS and routing too
+app.add_middleware(TimingMiddleware)
 
 app.include_router(api_router, prefix="/api")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
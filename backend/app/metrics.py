@@ -0,0 +1,363 @@
+"""
+Per-request performance instrumentation.
+
+- `MongoCommandListener` (registered on the shared client) times every Mongo
+  command and charges it to the current request.
+- `stage(name)` / `@timed(name)` time pipeline stages (ocr, cds); `TimedRoute`
+  adds "render", the time FastAPI spends validating and serializing around
+  the endpoint.
+- `TimingMiddleware` ties it together per request: a `Server-Timing` header,
+  Prometheus histograms (rendered by `render_metrics()` at /metrics) and, with
+  SLOW_REQUEST_MS set, a log line with the Mongo command breakdown. Streaming
+  responses (SSE, NDJSON) last as long as the client stays connected, so their
+  durations go to a separate histogram instead of the request latency one.
+
+Per-request state lives in a contextvar, so nothing is threaded through calls
+and work outside a request (seeding, triage sync, pool threads) only feeds the
+global histograms.
+"""
+import functools
+import inspect
+import logging
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+from .cache import bundle_cache, summary_cache
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 disables the slow-request log
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") not in ("0", "false", "no")
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+STREAM_BUCKETS = (0.1, 1.0, 10.0, 60.0, 300.0, 900.0, 3600.0)
+
+STREAMING_MEDIA_TYPES = (b"text/event-stream", b"application/x-ndjson")
+
+
+class Histogram:
+    """Prometheus-style histogram keyed by label values."""
+
+    def __init__(self, name: str, help_text: str, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(key, list(counts), total, n) for key, (counts, total, n) in self._series.items()]
+        for key, counts, total, n in sorted(series):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key))
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f'{self.name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}'
+            braced = f"{{{labels}}}" if labels else ""
+            yield f"{self.name}_sum{braced} {total}"
+            yield f"{self.name}_count{braced} {n}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status")
+)
+STREAM_SECONDS = Histogram(
+    "http_stream_duration_seconds", "Streaming response (SSE, NDJSON) lifetime.",
+    ("method", "route", "status"), STREAM_BUCKETS,
+)
+REQUEST_MONGO_COMMANDS = Histogram(
+    "http_request_mongo_commands", "Mongo commands issued per request.", ("route",), COUNT_BUCKETS
+)
+REQUEST_MONGO_SECONDS = Histogram(
+    "http_request_mongo_duration_seconds", "Total Mongo command time per request.", ("route",)
+)
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds", "Time spent per pipeline stage.", ("stage",)
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "Mongo command latency.", ("command",)
+)
+HISTOGRAMS = (REQUEST_SECONDS, STREAM_SECONDS, REQUEST_MONGO_COMMANDS, REQUEST_MONGO_SECONDS, STAGE_SECONDS, MONGO_COMMAND_SECONDS)
+
+
+class RequestStats:
+    """Everything measured for one request."""
+
+    __slots__ = ("started", "mongo_count", "mongo_seconds", "commands", "stages", "_targets")
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.mongo_count = 0
+        self.mongo_seconds = 0.0
+        self.commands = {}  # (command, collection) -> [count, seconds]
+        self.stages = {}  # stage -> seconds
+        self._targets = {}  # in-flight request_id -> collection
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        parts = [f'mongo;dur={self.mongo_seconds * 1000:.2f};desc="commands={self.mongo_count}"']
+        parts += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def breakdown(self) -> str:
+        return ", ".join(
+            f"{command} {collection} x{count} {seconds * 1000:.1f}ms"
+            for (command, collection), (count, seconds) in sorted(
+                self.commands.items(), key=lambda item: -item[1][1]
+            )
+        )
+
+
+_request = ContextVar("request_stats", default=None)
+_open_stages = ContextVar("open_stages", default=())
+
+
+def current_stats():
+    """RequestStats of the request being served, or None outside a request."""
+    return _request.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as pipeline stage `name`. Nested blocks of the same stage count once."""
+    open_stages = _open_stages.get()
+    if name in open_stages:
+        yield
+        return
+    token = _open_stages.set(open_stages + (name,))
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - started
+        _open_stages.reset(token)
+        STAGE_SECONDS.observe(elapsed, name)
+        stats = _request.get()
+        if stats is not None:
+            stats.add_stage(name, elapsed)
+
+
+def timed(name: str):
+    """Decorator form of stage() for sync and async functions."""
+
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with stage(name):
+                    return func(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times Mongo commands; charges them to the current request when there is one."""
+
+    def started(self, event):
+        stats = _request.get()
+        if stats is not None:
+            target = event.command.get(event.command_name)
+            if not isinstance(target, str):
+                target = event.command.get("collection", "")  # getMore carries a cursor id
+            stats._targets[event.request_id] = target
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, event.command_name)
+        stats = _request.get()
+        if stats is None:
+            return
+        stats.mongo_count += 1
+        stats.mongo_seconds += seconds
+        key = (event.command_name, stats._targets.pop(event.request_id, ""))
+        entry = stats.commands.get(key)
+        if entry is None:
+            stats.commands[key] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+
+command_listener = MongoCommandListener()
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that records "render": time in FastAPI's request handler outside
+    the endpoint itself (parameter validation and response serialization).
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            started = perf_counter()
+            response = await handler(request)
+            stats = _request.get()
+            if stats is not None:
+                endpoint = stats.stages.pop("endpoint", 0.0)
+                stats.add_stage("render", perf_counter() - started - endpoint)
+            return response
+
+        return timed_handler
+
+
+def _timed_endpoint(endpoint):
+    if getattr(endpoint, "_timed_endpoint", False) or not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            stats = _request.get()
+            if stats is not None:
+                stats.add_stage("endpoint", perf_counter() - started)
+
+    wrapper._timed_endpoint = True
+    return wrapper
+
+
+def route_label(scope) -> str:
+    """Full route template, e.g. "/api/patient/{patient_id}"."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        # Unmatched paths share one label so 404 scans can't blow up cardinality
+        return "unmatched"
+    # Newer FastAPI keeps included routes unprefixed and records the effective
+    # (prefixed) route per request
+    fastapi_scope = scope.get("fastapi")
+    if isinstance(fastapi_scope, dict):
+        path = getattr(fastapi_scope.get("effective_route_context"), "path", None) or path
+    return scope.get("root_path", "") + path
+
+
+def _is_streaming(headers) -> bool:
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            return value.split(b";")[0].strip().lower() in STREAMING_MEDIA_TYPES
+    return False
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware: per-request stats, Server-Timing, histograms, slow log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request.set(stats)
+        status = 500
+        streaming = False
+
+        async def send_with_timing(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = _is_streaming(message.get("headers", ()))
+                if SERVER_TIMING:
+                    timing = stats.server_timing(perf_counter() - stats.started)
+                    message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request.reset(token)
+            self.record(scope, stats, status, perf_counter() - stats.started, streaming)
+
+    @staticmethod
+    def record(scope, stats: RequestStats, status: int, total: float, streaming: bool = False):
+        route = route_label(scope)
+        REQUEST_MONGO_COMMANDS.observe(stats.mongo_count, route)
+        REQUEST_MONGO_SECONDS.observe(stats.mongo_seconds, route)
+        if streaming:
+            STREAM_SECONDS.observe(total, scope["method"], route, str(status))
+            return
+        REQUEST_SECONDS.observe(total, scope["method"], route, str(status))
+        if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+            stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in stats.stages.items())
+            logger.warning(
+                "slow request %s %s (%s) %d in %.1fms: %s mongo=%d/%.1fms [%s]",
+                scope["method"], scope["path"], route, status, total * 1000,
+                stages, stats.mongo_count, stats.mongo_seconds * 1000, stats.breakdown(),
+            )
+
+
+def _cache_metrics():
+    caches = {"bundles": bundle_cache.stats(), "summaries": summary_cache.stats()}
+    for field, kind, help_text in (
+        ("hits", "counter", "Cache hits."),
+        ("misses", "counter", "Cache misses."),
+        ("evictions", "counter", "Entries evicted for size."),
+        ("expirations", "counter", "Entries dropped for TTL."),
+        ("size", "gauge", "Entries currently cached."),
+    ):
+        name = f"cache_{field}_total" if kind == "counter" else f"cache_{field}"
+        yield f"# HELP {name} {help_text}"
+        yield f"# TYPE {name} {kind}"
+        for cache, stats in caches.items():
+            yield f'{name}{{cache="{cache}"}} {stats[field]}'
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(_cache_metrics())
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, ConfigDict
+from typing import List, Dict, Any, Literal, Optional
 
 class Patient(BaseModel):
     patient_id: int
@@ -10,7 +10,34 @@ class Patient(BaseModel):
     gender: str
     race: str
 
+class FHIRResource(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    resourceType: str
+
+class FHIREntry(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    resource: FHIRResource
+
 class FHIRBundle(BaseModel):
     resourceType: str
     type: str
-    entry: List[Dict[str, Any]]
+    entry: List[FHIREntry]
+
+class BatchFilter(BaseModel):
+    status: Optional[Literal["critical", "normal"]] = None
+    gender: Optional[str] = None
+
+class PipelineBatchRequest(BaseModel):
+    patient_ids: Optional[List[int]] = None
+    mrns: Optional[List[str]] = None
+    filter: Optional[BatchFilter] = None
+    include_bundle: bool = False
+
+class IngestDocument(BaseModel):
+    text: str
+    content_type: str = "text/plain"
+
+class IngestRequest(BaseModel):
+    mrn: Optional[str] = None
+    bundle: Optional[Dict[str, Any]] = None
+    document: Optional[IngestDocument] = None
@@ -0,0 +1,70 @@
+"""
+Keyset (cursor) pagination on patient_id.
+
+Cursors are opaque to clients: base64url JSON holding the boundary key, the
+direction and the page number they lead to. Without a cursor, listings fall
+back to page/page_size (skip) so existing callers keep working.
+"""
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException
+
+KEY = "patient_id"
+
+
+def encode_cursor(key, direction: str, page: int) -> str:
+    payload = json.dumps({"k": key, "d": direction, "p": page}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if data["d"] not in ("next", "prev") or not isinstance(data["p"], int):
+            raise ValueError(cursor)
+        return data
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def keyset_page(collection, query: dict, projection: dict, page: int, page_size: int, cursor: str = None):
+    """
+    Fetch one page of `collection` ordered by patient_id.
+    Returns (rows, page, next_cursor, prev_cursor).
+    """
+    if cursor:
+        c = decode_cursor(cursor)
+        page = max(1, c["p"])
+        forward = c["d"] == "next"
+        bound = {"$gt": c["k"]} if forward else {"$lt": c["k"]}
+        rows = await (
+            collection.find({**query, KEY: bound}, projection)
+            .sort(KEY, 1 if forward else -1)
+            .limit(page_size + 1)
+            .to_list(None)
+        )
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if forward:
+            has_next, has_prev = more, True
+        else:
+            rows.reverse()
+            has_next, has_prev = True, more
+    else:
+        rows = await (
+            collection.find(query, projection)
+            .sort(KEY, 1)
+            .skip((page - 1) * page_size)
+            .limit(page_size + 1)
+            .to_list(None)
+        )
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev = page > 1
+
+    next_cursor = encode_cursor(rows[-1][KEY], "next", page + 1) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0][KEY], "prev", page - 1) if rows and has_prev else None
+    return rows, page, next_cursor, prev_cursor
@@ -1,144 +1,346 @@
-from fastapi import APIRouter, Query
-from app.db import patients_collection, fhir_collection
-from app.services import mock_ocr_pipeline, mock_cds, has_critical_alerts
+import asyncio
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.batch import cds_chunk, chunks_by_filter, chunks_by_ids, chunks_by_mrns, get_executor, stream_batch
+from app.cache import counts, bundle_cache, summary_cache
+from app.db import patients_collection, triage_collection
+from app.events import broadcaster
+from app.fhir_utils import BundleView
+from app.metrics import TimedRoute
+from app.ingest import enqueue, get_job
+from app.models import FHIRBundle, IngestRequest, PipelineBatchRequest
+from app.pagination import keyset_page
+from app.services import (
+    mock_ocr_pipeline,
+    fetch_bundle,
+    ocr_pipeline_many,
+    critical_alerts,
+)
+
+router = APIRouter(route_class=TimedRoute)
+
+
+async def patients_total():
+    """Cached, metadata-based patient count (no collection scan)."""
+    return await counts.get("patients", lambda: patients_collection().estimated_document_count())
+
+
+async def triage_total(status: str):
+    return await counts.get(
+        ("triage", status), lambda: triage_collection().count_documents({"status": status})
+    )
+
+
+async def offload_cds(bundles: list) -> list:
+    """CDS for `bundles` on the shared pool (batch.cds_chunk), keeping the event loop free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), cds_chunk, bundles)
+
+
+def page_response(items, total, page, page_size, next_cursor, prev_cursor):
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "next": next_cursor,
+        "prev": prev_cursor,
+    }
 
-router = APIRouter()
 
 @router.get("/patients")
-def get_patients(
+async def get_patients(
     page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100)
+    page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
 ):
-    skip = (page - 1) * page_size
-    total = patients_collection.count_documents({})
-    items = list(
-        patients_collection.find({}, {"_id": 0})
-        .skip(skip)
-        .limit(page_size)
+    total = await patients_total()
+    items, page, next_cursor, prev_cursor = await keyset_page(
+        patients_collection(), {}, {"_id": 0}, page, page_size, cursor
     )
-    return {"items": items, "total": total, "page": page, "page_size": page_size}
+    return page_response(items, total, page, page_size, next_cursor, prev_cursor)
 
 
 @router.get("/patients/count")
-def get_patients_count():
-    total = patients_collection.count_documents({})
+async def get_patients_count():
+    total = await patients_total()
     return {"total": total}
 
 
 @router.get("/patient/{patient_id}")
-def get_patient(patient_id: int):
-    return patients_collection.find_one({"patient_id": patient_id}, {"_id": 0})
+async def get_patient(patient_id: int):
+    return await patients_collection().find_one({"patient_id": patient_id}, {"_id": 0})
+
+
+@router.post("/pipeline/batch")
+async def run_pipeline_batch(request: PipelineBatchRequest):
+    """
+    Run the pipeline for many patients (patient_ids, mrns or a filter) and
+    stream one NDJSON line per patient as chunks complete.
+    """
+    if request.patient_ids is not None:
+        chunks = chunks_by_ids(request.patient_ids)
+    elif request.mrns is not None:
+        chunks = chunks_by_mrns(request.mrns)
+    elif request.filter is not None:
+        chunks = chunks_by_filter(request.filter.status, request.filter.gender)
+    else:
+        raise HTTPException(status_code=422, detail="Provide patient_ids, mrns or filter")
+
+    return StreamingResponse(
+        stream_batch(chunks, include_bundle=request.include_bundle),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/ingest", status_code=202)
+async def ingest(request: IngestRequest):
+    """
+    Queue a FHIR bundle or a clinical document for the ingestion workers.
+    Poll GET /ingest/{job_id} for the outcome.
+    """
+    if (request.bundle is None) == (request.document is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of bundle or document")
+    mrn = request.mrn or (request.bundle or {}).get("mrn")
+    if not mrn:
+        raise HTTPException(status_code=422, detail="mrn is required")
+    if request.bundle is not None:
+        try:
+            FHIRBundle.model_validate(request.bundle)
+        except ValidationError as exc:
+            raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False, include_input=False))
+    if not await patients_collection().find_one({"mrn": mrn}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="No patient with this mrn")
+    if request.bundle is not None:
+        job = await enqueue("bundle", mrn, request.bundle)
+    else:
+        job = await enqueue("document", mrn, request.document.model_dump())
+    return job
+
+
+@router.get("/ingest/{job_id}")
+async def get_ingest_job(job_id: str):
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such ingest job")
+    return job
+
+
+async def pipeline_state(patient_id: int):
+    """
+    The patient's mrn, bundle_hash and precomputed alerts from the triage
+    store (one small indexed read), or None when there is no stored bundle
+    version to key on. `version` keys the caches and ETags: it covers the
+    alerts too, since they are served from the store alongside the bundle.
+    """
+    state = await triage_collection().find_one(
+        {"patient_id": patient_id}, {"_id": 0, "mrn": 1, "bundle_hash": 1, "alerts": 1}
+    )
+    if not state or not state.get("bundle_hash"):
+        return None
+    alerts = json.dumps(state.get("alerts", []), separators=(",", ":"))
+    state["version"] = f'{state["bundle_hash"]}.{hashlib.sha1(alerts.encode("utf-8")).hexdigest()[:12]}'
+    return state
+
+
+async def cached_pipeline(state: dict):
+    """
+    (bundle, cds) for a pipeline_state(), served from bundle_cache when
+    current. CDS comes from the triage store; it ran when the bundle was stored.
+    """
+    hit = bundle_cache.get(state["mrn"], state["version"])
+    if hit is not None:
+        return hit
+    bundle = await fetch_bundle(state["mrn"])
+    cds = {"alerts": state.get("alerts", [])} if "error" not in bundle else {}
+    if "error" not in bundle:
+        bundle_cache.put(state["mrn"], state["version"], (bundle, cds))
+    return bundle, cds
+
+
+def make_etag(version: str, view: str) -> str:
+    return f'"{version}-{view}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
 
 
 @router.get("/pipeline/{patient_id}")
-def run_pipeline(patient_id: int):
-    bundle = mock_ocr_pipeline(patient_id)
-    cds = mock_cds(bundle)
+async def run_pipeline(
+    patient_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+):
+    state = await pipeline_state(patient_id)
+    if state is None:
+        bundle = await mock_ocr_pipeline(patient_id)
+        (cds,) = await offload_cds([bundle])
+        return {"bundle": bundle, "cds": cds}
+
+    etag = make_etag(state["version"], "full")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    bundle, cds = await cached_pipeline(state)
+    if "error" not in bundle:
+        set_etag(response, etag)
     return {"bundle": bundle, "cds": cds}
 
 
+async def triage_page(status: str, page: int, page_size: int, cursor: Optional[str] = None):
+    """
+    One page of the persisted triage store for `status`, joined to patient docs.
+    Returns (total, [(patient, alerts), ...], page, next_cursor, prev_cursor)
+    ordered by patient_id.
+    """
+    total = await triage_total(status)
+    rows, page, next_cursor, prev_cursor = await keyset_page(
+        triage_collection(),
+        {"status": status},
+        {"_id": 0, "patient_id": 1, "alerts": 1},
+        page,
+        page_size,
+        cursor,
+    )
+    patients = {
+        p["patient_id"]: p
+        async for p in patients_collection().find(
+            {"patient_id": {"$in": [r["patient_id"] for r in rows]}}, {"_id": 0}
+        )
+    }
+    rows = [(patients[r["patient_id"]], r["alerts"]) for r in rows if r["patient_id"] in patients]
+    return total, rows, page, next_cursor, prev_cursor
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {"bundles": bundle_cache.stats(), "summaries": summary_cache.stats()}
+
+
 @router.get("/critical/count")
-def get_critical_count():
-    critical_count = 0
-    patients = list(patients_collection.find({}, {"_id": 0, "patient_id": 1}))
-    for p in patients:
-        alerts = has_critical_alerts(p["patient_id"])
-        if alerts:
-            critical_count += 1
+async def get_critical_count():
+    critical_count = await triage_total("critical")
     return {"critical_patient_count": critical_count}
 
 
+@router.get("/triage/stream")
+async def stream_triage(last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent events: a `snapshot` of critical/normal totals, then a `status`
+    event whenever a patient's triage status changes. Resumes from Last-Event-ID.
+    """
+    return StreamingResponse(
+        broadcaster.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/critical/patients")
-def get_critical_patients(
+async def get_critical_patients(
     page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100)
+    page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
 ):
-    all_patients = list(patients_collection.find({}, {"_id": 0}))
-    critical_patients_all = []
-    for p in all_patients:
-        alerts = has_critical_alerts(p["patient_id"])
-        if alerts:
-            critical_patients_all.append({"patient": p, "alerts": alerts})
-
-    total = len(critical_patients_all)
-    start = (page - 1) * page_size
-    end = start + page_size
-    items = critical_patients_all[start:end]
-
-    return {"items": items, "total": total, "page": page, "page_size": page_size}
+    total, rows, page, next_cursor, prev_cursor = await triage_page("critical", page, page_size, cursor)
+    items = [{"patient": p, "alerts": alerts} for p, alerts in rows]
 
+    return page_response(items, total, page, page_size, next_cursor, prev_cursor)
 
-@router.get("/pipeline/simple/{patient_id}")
-def run_pipeline_simple(patient_id: int):
-    from app.services import mock_ocr_pipeline, mock_cds
-
-    bundle = mock_ocr_pipeline(patient_id)
-    if "error" in bundle:
-        return bundle
 
-    cds = mock_cds(bundle)
+# Everything summarize() reads; its alerts come from the triage store, not CDS
+SUMMARY_RESOURCE_TYPES = {"Patient", "Condition", "MedicationRequest"}
+SUMMARY_OBSERVATIONS = {"Blood pressure", "Body mass index"}
 
-    patient = next(
-        (e["resource"] for e in bundle["entry"] if e["resource"]["resourceType"] == "Patient"),
-        None
-    )
-    name = f"{patient['name'][0]['given'][0]} {patient['name'][0]['family']}" if patient else "Unknown"
-    gender = patient.get("gender") if patient else ""
-    birth_date = patient.get("birthDate") if patient else ""
-
-    conditions = [
-        e["resource"]["code"]["text"]
-        for e in bundle["entry"]
-        if e["resource"]["resourceType"] == "Condition"
-    ]
-
-    medications = [
-        {
-            "medication": e["resource"]["medicationCodeableConcept"]["text"],
-            "instructions": e["resource"]["dosageInstruction"][0]["text"]
-        }
-        for e in bundle["entry"]
-        if e["resource"]["resourceType"] == "MedicationRequest"
-    ]
 
+def summarize(view: BundleView, cds: dict) -> dict:
+    patient = view.patient
     vitals = {}
-    for e in bundle["entry"]:
-        res = e["resource"]
-        if res["resourceType"] == "Observation" and res["code"]["text"] == "Blood pressure":
-            vitals["blood_pressure"] = f"{res['component'][0]['valueQuantity']['value']}/{res['component'][1]['valueQuantity']['value']} mmHg"
-        if res["resourceType"] == "Observation" and res["code"]["text"] == "Body mass index":
-            vitals["bmi"] = f"{res['valueQuantity']['value']} {res['valueQuantity']['unit']}"
+    bp = view.blood_pressure
+    if bp is not None:
+        vitals["blood_pressure"] = f"{bp.systolic}/{bp.diastolic} mmHg"
+    bmi = view.bmi
+    if bmi is not None:
+        vitals["bmi"] = f"{bmi.value} {bmi.unit}"
 
     return {
         "patient": {
-            "name": name,
-            "gender": gender,
-            "dob": birth_date,
+            "name": patient.name if patient else "Unknown",
+            "gender": patient.gender if patient else "",
+            "dob": patient.birth_date if patient else "",
         },
-        "conditions": conditions,
-        "medications": medications,
+        "conditions": [c.text for c in view.conditions],
+        "medications": [
+            {"medication": m.medication, "instructions": m.instructions}
+            for m in view.medications
+        ],
         "vitals": vitals,
         "alerts": cds.get("alerts", []),
     }
 
 
-def build_patient_overview_item(p: dict) -> dict:
-    """
-    Returns a compact, nurse-friendly overview item:
-    - patient (mrn, name, age, gender, patient_id)
-    - status ('critical' | 'normal')
-    - alerts (list[str])  # from CDS, can include warnings/info
-    """
-    pid = p["patient_id"]
-    # Build CDS once so lists can render alert badges consistently
-    bundle = mock_ocr_pipeline(pid)
-    cds = mock_cds(bundle) if "error" not in bundle else {}
-    alerts = cds.get("alerts", []) or []
-    status = "critical" if has_critical_alerts(pid) else "normal"
-
+@router.get("/pipeline/simple/{patient_id}")
+async def run_pipeline_simple(
+    patient_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+):
+    state = await pipeline_state(patient_id)
+    if state is None:
+        bundle = await mock_ocr_pipeline(patient_id)
+        if "error" in bundle:
+            return bundle
+        (cds,) = await offload_cds([bundle])
+        return summarize(BundleView(bundle), cds)
+
+    etag = make_etag(state["version"], "simple")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    mrn, version = state["mrn"], state["version"]
+    summary = summary_cache.get(mrn, version)
+    if summary is None:
+        full = bundle_cache.get(mrn, version)
+        if full is not None:
+            bundle, cds = full
+            view = BundleView(bundle)
+        else:
+            # Only pull the resource types the summary needs
+            bundle = await fetch_bundle(mrn, SUMMARY_RESOURCE_TYPES, SUMMARY_OBSERVATIONS)
+            if "error" in bundle:
+                return bundle
+            view = BundleView(bundle)
+            cds = {"alerts": state.get("alerts", [])}
+        summary = summarize(view, cds)
+        summary_cache.put(mrn, version, summary)
+
+    set_etag(response, etag)
+    return summary
+
+
+def overview_item(p: dict, status: str, alerts: list) -> dict:
     return {
         "patient": {
-            "patient_id": pid,
+            "patient_id": p["patient_id"],
             "mrn": p.get("mrn"),
             "first_name": p.get("first_name"),
             "last_name": p.get("last_name"),
@@ -149,42 +351,57 @@ def build_patient_overview_item(p: dict) -> dict:
         "alerts": alerts,
     }
 
+
+async def build_overview_items(patients: list) -> list:
+    """
+    Overview items for a page of patients, read from the triage store in one
+    query. Only patients without a triage doc yet fall back to running the
+    pipeline (one batched fetch and CDS pass for those).
+    """
+    stored = {
+        d["patient_id"]: (d["status"], d.get("alerts", []) or [])
+        async for d in triage_collection().find(
+            {"patient_id": {"$in": [p["patient_id"] for p in patients]}},
+            {"_id": 0, "patient_id": 1, "status": 1, "alerts": 1},
+        )
+    }
+    missing = [p["patient_id"] for p in patients if p["patient_id"] not in stored]
+    if missing:
+        bundles = await ocr_pipeline_many(missing)
+        for pid, cds in zip(missing, await offload_cds([bundles[pid] for pid in missing])):
+            alerts = cds.get("alerts", []) or []
+            stored[pid] = ("critical" if critical_alerts(alerts) else "normal", alerts)
+    return [overview_item(p, *stored[p["patient_id"]]) for p in patients]
+
+
 @router.get("/patients/overview")
-def get_patients_overview(
+async def get_patients_overview(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
 ):
     """
     Paginated 'all patients' list WITH server-computed status and CDS alerts.
+    Pass the returned `next`/`prev` cursor to page without skip.
     """
-    skip = (page - 1) * page_size
-    total = patients_collection.count_documents({})
-    raw_items = list(
-        patients_collection.find({}, {"_id": 0}).skip(skip).limit(page_size)
+    total = await patients_total()
+    raw_items, page, next_cursor, prev_cursor = await keyset_page(
+        patients_collection(), {}, {"_id": 0}, page, page_size, cursor
     )
 
-    items = [build_patient_overview_item(p) for p in raw_items]
-    return {"items": items, "total": total, "page": page, "page_size": page_size}
+    items = await build_overview_items(raw_items)
+    return page_response(items, total, page, page_size, next_cursor, prev_cursor)
 
 @router.get("/normal/patients")
-def get_normal_patients(
+async def get_normal_patients(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
 ):
     """
     Paginated list of NON-CRITICAL patients. Each item includes patient + alerts.
     """
-    # Pull all (the cohort is small in this mock; in production, do two-pass with skip/limit)
-    all_patients = list(patients_collection.find({}, {"_id": 0}))
-    normal_all = []
-    for p in all_patients:
-        if not has_critical_alerts(p["patient_id"]):
-            normal_all.append(build_patient_overview_item(p))
-
-    total = len(normal_all)
-    start = (page - 1) * page_size
-    end = start + page_size
-    items = normal_all[start:end]
-
-    return {"items": items, "total": total, "page": page, "page_size": page_size}
+    total, rows, page, next_cursor, prev_cursor = await triage_page("normal", page, page_size, cursor)
+    items = [overview_item(p, "normal", alerts) for p, alerts in rows]
 
+    return page_response(items, total, page, page_size, next_cursor, prev_cursor)
@@ -1,24 +1,224 @@
+"""
+Streaming seeder for patients (CSV) and FHIR bundles (JSON array).
+
+Both sources are read incrementally and written in unordered batches, so
+memory stays flat regardless of cohort size. Runs from app startup (only when
+the collections are empty) or standalone:
+
+    python -m app.seed_data --patients PATH --bundles PATH --batch-size 1000
+"""
+import argparse
+import asyncio
 import csv
-from .db import patients_collection, fhir_collection
-import os
 import json
+import os
+import re
+import sys
+import time
+
+from pymongo import ASCENDING, InsertOne, ReplaceOne
+
+from . import db
+from .cache import counts, invalidate_bundles
+from .db import patients_collection, fhir_collection
+from .events import broadcaster
+from .ingest import ensure_ingest_indexes
+from .triage import ensure_triage_indexes, refresh_triage_for_mrns
+
+PATIENTS_CSV = os.getenv("SEED_PATIENTS_CSV", "/mock_data/mock_emr_patients.csv")
+FHIR_BUNDLES_JSON = os.getenv(
+    "SEED_FHIR_BUNDLES",
+    os.path.join(os.path.dirname(__file__), "mock_data", "mock_fhir_bundles.json"),
+)
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "1000"))
+SEED_ON_STARTUP = os.getenv("SEED_ON_STARTUP", "1") not in ("0", "false", "no")
+
+READ_CHUNK_SIZE = 1 << 16
+_WS = re.compile(r"\s*")
+
+
+async def ensure_indexes():
+    """Create the indexes every pipeline lookup filters on (idempotent)."""
+    await patients_collection().create_index([("patient_id", ASCENDING)], unique=True)
+    await patients_collection().create_index([("mrn", ASCENDING)])
+    await fhir_collection().create_index([("mrn", ASCENDING)])
+    await ensure_triage_indexes()
+    await ensure_ingest_indexes()
+
+
+def iter_json_array(fp, chunk_size: int = READ_CHUNK_SIZE):
+    """Yield the items of a top-level JSON array, reading `fp` in chunks."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    expect = "["  # '[' -> 'item_or_end' -> 'sep_or_end' -> 'item' ...
+
+    def refill(size):
+        nonlocal buf, pos, eof
+        chunk = fp.read(size)
+        buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+    while True:
+        pos = _WS.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            refill(chunk_size)
+            continue
+
+        ch = buf[pos]
+        if expect == "[":
+            if ch != "[":
+                raise ValueError("Expected a top-level JSON array")
+            pos += 1
+            expect = "item_or_end"
+            continue
+        if ch == "]" and expect in ("item_or_end", "sep_or_end"):
+            return
+        if expect == "sep_or_end":
+            if ch != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {ch!r}")
+            pos += 1
+            expect = "item"
+            continue
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # Only trust the item once the delimiter after it has been read:
+                # a number cut by the chunk boundary ("3" | ".5") decodes early
+                after = _WS.match(buf, end).end()
+                if eof or (after < len(buf) and buf[after] in ",]"):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # Grow reads geometrically so large items aren't re-parsed too often
+            refill(max(chunk_size, len(buf) - pos))
+        yield item
+        pos = end
+        expect = "sep_or_end"
+
+
+def iter_patients(path: str):
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            row["patient_id"] = int(row["patient_id"])
+            row["age"] = int(row["age"])
+            yield row
+
+
+def iter_bundles(path: str):
+    with open(path) as f:
+        yield from iter_json_array(f)
+
+
+def _batches(items, batch_size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Progress:
+    """Prints running count and throughput to stderr."""
+
+    def __init__(self, label: str, stream=sys.stderr):
+        self.label = label
+        self.stream = stream
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def update(self, n: int):
+        self.count += n
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        print(f"{self.label}: {self.count} docs in {elapsed:.1f}s ({rate:.0f} docs/s)", file=self.stream)
+
+
+async def _write(collection, docs, key: str, upsert: bool):
+    if upsert:
+        ops = [ReplaceOne({key: d[key]}, d, upsert=True) for d in docs]
+    else:
+        ops = [InsertOne(d) for d in docs]
+    await collection.bulk_write(ops, ordered=False)
+    counts.invalidate()
+
+
+async def seed_patients(
+    path: str = PATIENTS_CSV,
+    batch_size: int = SEED_BATCH_SIZE,
+    upsert: bool = False,
+    progress: Progress = None,
+):
+    """
+    Load the patients CSV in batches. Without `upsert` this only seeds an
+    empty collection (startup behaviour); with it, rows replace by patient_id.
+    """
+    if not upsert and await patients_collection().count_documents({}, limit=1):
+        return 0
+    count = 0
+    for batch in _batches(iter_patients(path), batch_size):
+        await _write(patients_collection(), batch, "patient_id", upsert)
+        count += len(batch)
+        if progress:
+            progress.update(len(batch))
+    if count:
+        # Patient totals moved; one snapshot beats per-patient deltas
+        broadcaster.resync()
+    return count
+
+
+async def seed_fhir(
+    path: str = FHIR_BUNDLES_JSON,
+    batch_size: int = SEED_BATCH_SIZE,
+    upsert: bool = False,
+    progress: Progress = None,
+):
+    """
+    Stream bundles from the JSON array in batches and refresh the triage store
+    for each batch. Same `upsert` semantics as seed_patients (keyed by mrn).
+    """
+    if not upsert and await fhir_collection().count_documents({}, limit=1):
+        return 0
+    count = 0
+    for batch in _batches(iter_bundles(path), batch_size):
+        await _write(fhir_collection(), batch, "mrn", upsert)
+        invalidate_bundles(*(b.get("mrn") for b in batch))
+        await refresh_triage_for_mrns([b.get("mrn") for b in batch])
+        count += len(batch)
+        if progress:
+            progress.update(len(batch))
+    return count
+
+
+async def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed patients and FHIR bundles into Mongo.")
+    parser.add_argument("--patients", default=PATIENTS_CSV, help="patients CSV path")
+    parser.add_argument("--bundles", default=FHIR_BUNDLES_JSON, help="FHIR bundles JSON array path")
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+    parser.add_argument("--skip-patients", action="store_true")
+    parser.add_argument("--skip-bundles", action="store_true")
+    parser.add_argument(
+        "--if-empty", action="store_true",
+        help="plain inserts, only into empty collections (default: upsert)",
+    )
+    args = parser.parse_args(argv)
+
+    db.connect()
+    try:
+        await ensure_indexes()
+        upsert = not args.if_empty
+        if not args.skip_patients:
+            await seed_patients(args.patients, args.batch_size, upsert, Progress("patients"))
+        if not args.skip_bundles:
+            await seed_fhir(args.bundles, args.batch_size, upsert, Progress("fhir_bundles"))
+    finally:
+        await db.close()
+
 
-def seed_patients():
-    if patients_collection.count_documents({}) == 0:
-        with open("/mock_data/mock_emr_patients.csv") as f:
-            reader = csv.DictReader(f)
-            patients = [row for row in reader]
-            for p in patients:
-                p["patient_id"] = int(p["patient_id"])
-                p["age"] = int(p["age"])
-            patients_collection.insert_many(patients)
-
-
-
-def seed_fhir():
-    if fhir_collection.count_documents({}) == 0:
-        file_path = os.path.join(os.path.dirname(__file__), "mock_data", "mock_fhir_bundles.json")
-        with open(file_path) as f:
-            bundles = json.load(f)
-            for bundle in bundles:
-                fhir_collection.insert_one(bundle)
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,88 +1,99 @@
 import random
 from .db import patients_collection, fhir_collection
+from .cds_rules import default_rules
+from .fhir_utils import BundleView, bundle_projection
+from .metrics import timed
 
-def mock_ocr_pipeline(patient_id: int):
-    patient = patients_collection.find_one({"patient_id": patient_id}, {"_id": 0, "mrn": 1})
+@timed("ocr")
+async def mock_ocr_pipeline(patient_id: int):
+    patient = await patients_collection().find_one({"patient_id": patient_id}, {"_id": 0, "mrn": 1})
     if not patient:
         return {"error": "No patient found"}
-    mrn = patient["mrn"]
+    return await fetch_bundle(patient["mrn"])
 
-    bundle = fhir_collection.find_one({"mrn": mrn}, {"_id": 0})  # use top-level mrn
+
+@timed("ocr")
+async def fetch_bundle(mrn: str, resource_types=None, observation_codes=None):
+    """Bundle by mrn; `resource_types`/`observation_codes` limit the entries fetched (see bundle_projection)."""
+    bundle = await fhir_collection().find_one(
+        {"mrn": mrn}, bundle_projection(resource_types, observation_codes)
+    )  # use top-level mrn
     if not bundle:
         return {"error": "No bundle found"}
-    bundle["nlp_status"] = "Parsed with mock LLM"
     return bundle
 
 
-
-
-def mock_cds(bundle):
+@timed("ocr")
+async def bundles_for_mrns(mrns):
+    """{mrn: bundle} for every MRN that has one, in a single $in query."""
+    bundles = {}
+    async for bundle in fhir_collection().find({"mrn": {"$in": list(mrns)}}, {"_id": 0}):
+        bundles.setdefault(bundle["mrn"], bundle)
+    return bundles
+
+
+@timed("ocr")
+async def ocr_pipeline_many(patient_ids):
+    """
+    Batch version of mock_ocr_pipeline: resolves every patient's bundle in a
+    single aggregate round trip ($lookup on mrn). Returns {patient_id: bundle},
+    with the same {"error": ...} placeholders for missing patients/bundles.
+    """
+    patient_ids = list(patient_ids)
+    results = {pid: {"error": "No patient found"} for pid in patient_ids}
+    if not patient_ids:
+        return results
+
+    rows = await patients_collection().aggregate([
+        {"$match": {"patient_id": {"$in": patient_ids}}},
+        {"$project": {"_id": 0, "patient_id": 1, "mrn": 1}},
+        {"$lookup": {
+            "from": fhir_collection().name,
+            "localField": "mrn",
+            "foreignField": "mrn",
+            "as": "bundles",
+        }},
+    ])
+    async for row in rows:
+        if not row["bundles"]:
+            results[row["patient_id"]] = {"error": "No bundle found"}
+            continue
+        bundle = row["bundles"][0]
+        bundle.pop("_id", None)
+        results[row["patient_id"]] = bundle
+    return results
+
+
+
+@timed("cds")
+def mock_cds(bundle, view: BundleView = None):
     """Simulate Clinical Decision Support with diverse alerts"""
-    alerts = []
-
-    for entry in bundle["entry"]:
-        res = entry["resource"]
-
-        # 🔹 Lab: Lipid panel
-        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Lipid panel":
-            for comp in res.get("component", []):
-                if comp["code"]["text"] == "LDL" and comp["valueQuantity"]["value"] >= 160:
-                    alerts.append("High LDL cholesterol: consider statin")
-                if comp["code"]["text"] == "HDL" and comp["valueQuantity"]["value"] < 40:
-                    alerts.append("Low HDL cholesterol: lifestyle modification advised")
-
-        # 🔹 Vitals: Blood pressure
-        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Blood pressure":
-            systolic = res["component"][0]["valueQuantity"]["value"]
-            diastolic = res["component"][1]["valueQuantity"]["value"]
-            if systolic >= 140 or diastolic >= 90:
-                alerts.append(f"Hypertension detected ({systolic}/{diastolic} mmHg)")
-
-        # 🔹 Vitals: BMI
-        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Body mass index":
-            bmi = res["valueQuantity"]["value"]
-            if bmi >= 30:
-                alerts.append(f"Obesity (BMI {bmi}): recommend weight management")
-            elif bmi < 18.5:
-                alerts.append(f"Underweight (BMI {bmi}): evaluate nutrition")
-
-        # 🔹 Lab: HbA1c
-        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "HbA1c":
-            hba1c = res["valueQuantity"]["value"]
-            if hba1c >= 6.5:
-                alerts.append(f"Diabetes control issue (HbA1c {hba1c}%)")
-
-        # 🔹 Lab: Creatinine (renal function)
-        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Creatinine":
-            cr = res["valueQuantity"]["value"]
-            if cr >= 1.5:
-                alerts.append(f"Elevated creatinine ({cr} mg/dL): check renal function")
-
-        # 🔹 Condition-based alerts
-        if res["resourceType"] == "Condition":
-            cond = res["code"]["text"].lower()
-            if "heart failure" in cond:
-                alerts.append("Heart failure: monitor fluid status")
-            if "copd" in cond:
-                alerts.append("COPD: ensure inhaler adherence")
-            if "hypertension" in cond:
-                alerts.append("Hypertension: consider tighter BP control")
-            if "diabetes" in cond:
-                alerts.append("Diabetes: monitor HbA1c and glucose levels")
-
+    alerts = default_rules.evaluate_view(view) if view is not None else default_rules.evaluate(bundle)
     return {"alerts": alerts or ["No critical alerts"]}
 
 
-
-def has_critical_alerts(patient_id: int):
-    """Return alerts if patient has critical ones, else None"""
-    bundle = mock_ocr_pipeline(patient_id)
-    if "error" in bundle:
-        return None
-    
-    cds = mock_cds(bundle)
-    alerts = cds.get("alerts", [])
+@timed("cds")
+def cds_many(bundles):
+    """
+    Run CDS for many bundles in one vectorized pass (see cds_rules).
+    Error placeholders yield an empty result.
+    """
+    bundles = list(bundles)
+    valid = [b for b in bundles if "error" not in b]
+    evaluated = iter(default_rules.evaluate_many(valid))
+    results = []
+    for b in bundles:
+        if "error" in b:
+            results.append({})
+        else:
+            results.append({"alerts": next(evaluated) or ["No critical alerts"]})
+    return results
+
+
+def critical_alerts(alerts):
+    """Return alerts if any of them is critical, else None"""
     # Check if all alerts are "No critical alerts"
-    if all(a == "No critical alerts" for a in alerts):
+    if not alerts or all(a == "No critical alerts" for a in alerts):
         return None
     return alerts
+
@@ -0,0 +1,188 @@
+"""
+Parse stages for the ingestion workers (see app.ingest).
+
+A parse stage turns an ingest job's payload (a FHIR bundle, or a clinical
+document's text) into the FHIR bundle that gets stored and run through CDS.
+A bundle job replaces the patient's stored bundle; a document only adds to
+it, so stages get the stored bundle as `existing` and return it with the
+document's resources merged in (see merge_bundle). The stage in use is
+INGEST_PARSE_STAGE, "module:Class", so a real OCR/LLM client can be dropped
+in without touching the workers:
+
+    class MyStage(ParseStage):
+        name = "my-llm"
+
+        async def parse(self, job, patient, existing):
+            ...
+            return merge_bundle(existing, bundle)
+
+Stages are async so slow model calls don't block the event loop; CPU-bound
+work should be pushed to a thread inside the stage.
+"""
+import abc
+import asyncio
+import importlib
+import json
+import os
+import re
+
+from .fhir_utils import code_text, components, observation
+
+INGEST_PARSE_STAGE = os.getenv("INGEST_PARSE_STAGE", "app.stages:MockLLMStage")
+MOCK_LLM_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "0"))
+
+
+class ParseStage(abc.ABC):
+    """
+    Base class: `parse()` returns the bundle to store for the job's mrn.
+    `existing` is the patient's stored bundle (None if there is none yet).
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def parse(self, job: dict, patient: dict = None, existing: dict = None) -> dict:
+        ...
+
+
+def _resource_key(res: dict) -> str:
+    return json.dumps(res, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def merge_bundle(existing: dict, parsed: dict) -> dict:
+    """
+    `existing` with the resources of `parsed` appended. The stored Patient
+    resource is kept; resources already present are skipped so re-sending a
+    document is a no-op, except an Observation is only skipped when it equals
+    the latest one with its code (later observations win).
+    """
+    if not existing:
+        return parsed
+    entries = list(existing.get("entry") or [])
+    seen = set()
+    latest = {}  # Observation code text -> key of the last one
+    for entry in entries:
+        res = entry["resource"]
+        if res["resourceType"] == "Observation":
+            latest[code_text(res)] = _resource_key(res)
+        else:
+            seen.add(_resource_key(res))
+    has_patient = any(e["resource"]["resourceType"] == "Patient" for e in entries)
+
+    for entry in parsed.get("entry") or []:
+        res = entry["resource"]
+        key = _resource_key(res)
+        if res["resourceType"] == "Patient" and has_patient:
+            continue
+        if res["resourceType"] == "Observation":
+            if latest.get(code_text(res)) == key:
+                continue
+            latest[code_text(res)] = key
+        elif key in seen:
+            continue
+        else:
+            seen.add(key)
+        entries.append(entry)
+    return {**parsed, **existing, "entry": entries}
+
+
+def _number(text: str):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+# Document line patterns -> Observation builders
+_MEASUREMENTS = [
+    (re.compile(rf"^(?:blood pressure|bp)\s*:?\s*{_NUMBER}\s*/\s*{_NUMBER}", re.I),
+     lambda s, d: components("Blood pressure", [
+         ("Systolic blood pressure", _number(s), "mmHg"),
+         ("Diastolic blood pressure", _number(d), "mmHg"),
+     ])),
+    (re.compile(rf"^(?:bmi|body mass index)\s*:?\s*{_NUMBER}", re.I),
+     lambda v: observation("Body mass index", _number(v), "kg/m2")),
+    (re.compile(rf"^(?:hba1c|a1c)\s*:?\s*{_NUMBER}", re.I),
+     lambda v: observation("HbA1c", _number(v), "%")),
+    (re.compile(rf"^creatinine\s*:?\s*{_NUMBER}", re.I),
+     lambda v: observation("Creatinine", _number(v), "mg/dL")),
+]
+_LIPIDS = re.compile(rf"^(LDL|HDL)\s*:?\s*{_NUMBER}", re.I)
+_CONDITION = re.compile(r"^(?:condition|diagnosis|dx)\s*:\s*(.+)$", re.I)
+_MEDICATION = re.compile(r"^(?:medication|rx)\s*:\s*([^-]+?)\s*(?:-\s*(.+))?$", re.I)
+
+
+class MockLLMStage(ParseStage):
+    """
+    Stand-in for the OCR/LLM step. Bundles pass through; documents are read
+    line by line ("BP: 150/95", "LDL: 170", "Condition: COPD",
+    "Medication: Metformin 500 mg - take twice daily", ...) and merged into
+    the stored bundle.
+    """
+
+    name = "mock-llm"
+    nlp_status = "Parsed with mock LLM"
+
+    def __init__(self, latency_ms: float = MOCK_LLM_LATENCY_MS):
+        self.latency = latency_ms / 1000
+
+    async def parse(self, job: dict, patient: dict = None, existing: dict = None) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if job["kind"] == "bundle":
+            bundle = dict(job["payload"])
+        else:
+            bundle = merge_bundle(existing, self.parse_document(job["payload"]["text"], patient))
+        bundle["mrn"] = job["mrn"]
+        bundle["nlp_status"] = self.nlp_status
+        return bundle
+
+    @staticmethod
+    def parse_document(text: str, patient: dict = None) -> dict:
+        entries = []
+        if patient:
+            entries.append({"resource": {
+                "resourceType": "Patient",
+                "id": str(patient["patient_id"]),
+                "name": [{"given": [patient.get("first_name", "")], "family": patient.get("last_name", "")}],
+                "gender": patient.get("gender"),
+            }})
+
+        lipids = []
+        for line in (raw.strip() for raw in text.splitlines()):
+            if not line:
+                continue
+            for pattern, build in _MEASUREMENTS:
+                match = pattern.match(line)
+                if match:
+                    entries.append({"resource": build(*match.groups())})
+                    break
+            else:
+                if match := _LIPIDS.match(line):
+                    lipids.append((match.group(1).upper(), _number(match.group(2)), "mg/dL"))
+                elif match := _CONDITION.match(line):
+                    entries.append({"resource": {
+                        "resourceType": "Condition",
+                        "clinicalStatus": {"text": "active"},
+                        "code": {"text": match.group(1).strip()},
+                    }})
+                elif match := _MEDICATION.match(line):
+                    entries.append({"resource": {
+                        "resourceType": "MedicationRequest",
+                        "status": "active",
+                        "medicationCodeableConcept": {"text": match.group(1).strip()},
+                        "dosageInstruction": [{"text": (match.group(2) or "").strip()}],
+                    }})
+        if lipids:
+            entries.append({"resource": components("Lipid panel", lipids)})
+        return {"resourceType": "Bundle", "type": "collection", "entry": entries}
+
+
+def load_stage(spec: str = INGEST_PARSE_STAGE) -> ParseStage:
+    """Instantiate the stage named by a "module:Class" spec."""
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"INGEST_PARSE_STAGE must look like 'module:Class', got {spec!r}")
+    stage_class = getattr(importlib.import_module(module_name), class_name)
+    if not issubclass(stage_class, ParseStage):
+        raise TypeError(f"{spec} is not a ParseStage")
+    return stage_class()
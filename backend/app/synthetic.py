@@ -0,0 +1,165 @@
+"""
+Synthetic cohort generator.
+
+Produces patients and matching FHIR bundles in the same shapes the seeder,
+CDS rules and summary view consume (Patient, Condition, MedicationRequest and
+Blood pressure / BMI / Lipid panel / HbA1c / Creatinine Observations).
+`abnormal_rate` is the chance each measurement lands past its CDS threshold.
+
+    python -m app.synthetic --patients 10000 --abnormal-rate 0.2 --out /tmp/cohort
+
+writes mock_emr_patients.csv and mock_fhir_bundles.json, ready for
+`python -m app.seed_data --patients ... --bundles ...`.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+from datetime import date
+
+from .fhir_utils import components, observation
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Wei", "Priya", "Carlos", "Aisha", "Hiroshi",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas",
+    "Taylor", "Moore", "Lee", "Patel", "Nguyen", "Kim", "Chen", "Okafor", "Singh",
+]
+GENDERS = ["male", "female"]
+RACES = ["White", "Black or African American", "Asian", "Hispanic or Latino", "Other"]
+
+# Condition text -> (medication, dosage instruction) commonly prescribed for it
+CONDITIONS = {
+    "Essential hypertension": ("Lisinopril 10 mg", "Take 1 tablet by mouth daily"),
+    "Type 2 diabetes mellitus": ("Metformin 500 mg", "Take 1 tablet by mouth twice daily with meals"),
+    "Congestive heart failure": ("Furosemide 40 mg", "Take 1 tablet by mouth every morning"),
+    "COPD": ("Tiotropium 18 mcg inhaler", "Inhale contents of 1 capsule daily"),
+    "Hyperlipidemia": ("Atorvastatin 20 mg", "Take 1 tablet by mouth at bedtime"),
+    "Asthma": ("Albuterol 90 mcg inhaler", "Inhale 2 puffs every 4-6 hours as needed"),
+    "Chronic kidney disease stage 3": ("Losartan 50 mg", "Take 1 tablet by mouth daily"),
+    "Osteoarthritis of knee": ("Acetaminophen 500 mg", "Take 2 tablets by mouth every 6 hours as needed"),
+}
+
+# (normal range, abnormal range) per measurement; abnormal ranges cross the CDS thresholds
+RANGES = {
+    "systolic": ((105, 135), (140, 185)),
+    "diastolic": ((62, 85), (90, 115)),
+    "bmi": ((18.6, 29.4), (30.0, 42.0)),
+    "ldl": ((70, 155), (160, 220)),
+    "hdl": ((41, 75), (25, 39)),
+    "hba1c": ((4.8, 6.3), (6.5, 11.0)),
+    "creatinine": ((0.6, 1.3), (1.5, 3.5)),
+}
+
+
+def _measure(rng: random.Random, name: str, abnormal_rate: float, digits: int = 0):
+    normal, abnormal = RANGES[name]
+    low, high = abnormal if rng.random() < abnormal_rate else normal
+    if digits == 0:
+        return rng.randint(int(low), int(high))
+    return round(rng.uniform(low, high), digits)
+
+
+def make_patient(patient_id: int, rng: random.Random) -> dict:
+    return {
+        "patient_id": patient_id,
+        "mrn": f"MRN{patient_id:07d}",
+        "first_name": rng.choice(FIRST_NAMES),
+        "last_name": rng.choice(LAST_NAMES),
+        "age": rng.randint(18, 95),
+        "gender": rng.choice(GENDERS),
+        "race": rng.choice(RACES),
+    }
+
+
+def make_bundle(patient: dict, rng: random.Random, abnormal_rate: float) -> dict:
+    birth_year = date.today().year - patient["age"]
+    entries = [{
+        "resource": {
+            "resourceType": "Patient",
+            "id": str(patient["patient_id"]),
+            "name": [{"given": [patient["first_name"]], "family": patient["last_name"]}],
+            "gender": patient["gender"],
+            "birthDate": f"{birth_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        }
+    }]
+
+    # More conditions when the cohort is sicker
+    n_conditions = min(len(CONDITIONS), int(rng.random() * (1 + 4 * abnormal_rate) * 2))
+    for text in rng.sample(sorted(CONDITIONS), n_conditions):
+        entries.append({"resource": {
+            "resourceType": "Condition",
+            "clinicalStatus": {"text": "active"},
+            "code": {"text": text},
+        }})
+        medication, instructions = CONDITIONS[text]
+        entries.append({"resource": {
+            "resourceType": "MedicationRequest",
+            "status": "active",
+            "medicationCodeableConcept": {"text": medication},
+            "dosageInstruction": [{"text": instructions}],
+        }})
+
+    entries.append({"resource": components("Blood pressure", [
+        ("Systolic blood pressure", _measure(rng, "systolic", abnormal_rate), "mmHg"),
+        ("Diastolic blood pressure", _measure(rng, "diastolic", abnormal_rate), "mmHg"),
+    ])})
+    entries.append({"resource": observation("Body mass index", _measure(rng, "bmi", abnormal_rate, 1), "kg/m2")})
+    entries.append({"resource": components("Lipid panel", [
+        ("LDL", _measure(rng, "ldl", abnormal_rate), "mg/dL"),
+        ("HDL", _measure(rng, "hdl", abnormal_rate), "mg/dL"),
+    ])})
+    if rng.random() < 0.7:
+        entries.append({"resource": observation("HbA1c", _measure(rng, "hba1c", abnormal_rate, 1), "%")})
+    if rng.random() < 0.7:
+        entries.append({"resource": observation("Creatinine", _measure(rng, "creatinine", abnormal_rate, 2), "mg/dL")})
+
+    return {"resourceType": "Bundle", "type": "collection", "mrn": patient["mrn"], "entry": entries}
+
+
+def generate(n: int, abnormal_rate: float = 0.2, missing_bundle_rate: float = 0.0, seed: int = 0):
+    """Yield (patient, bundle or None) pairs; deterministic for a given seed."""
+    rng = random.Random(seed)
+    for patient_id in range(1, n + 1):
+        patient = make_patient(patient_id, rng)
+        bundle = None if rng.random() < missing_bundle_rate else make_bundle(patient, rng, abnormal_rate)
+        yield patient, bundle
+
+
+def write_cohort(out_dir: str, n: int, abnormal_rate: float = 0.2, missing_bundle_rate: float = 0.0, seed: int = 0):
+    """Write the cohort as seeder inputs, streaming so 100k+ patients stay cheap. Returns (csv, json) paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, "mock_emr_patients.csv")
+    json_path = os.path.join(out_dir, "mock_fhir_bundles.json")
+    fields = ["patient_id", "mrn", "first_name", "last_name", "age", "gender", "race"]
+
+    with open(csv_path, "w", newline="") as pf, open(json_path, "w") as bf:
+        writer = csv.DictWriter(pf, fieldnames=fields)
+        writer.writeheader()
+        bf.write("[")
+        first = True
+        for patient, bundle in generate(n, abnormal_rate, missing_bundle_rate, seed):
+            writer.writerow(patient)
+            if bundle is not None:
+                bf.write("\n" if first else ",\n")
+                json.dump(bundle, bf, separators=(",", ":"))
+                first = False
+        bf.write("\n]\n")
+    return csv_path, json_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic patient cohort with FHIR bundles.")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--abnormal-rate", type=float, default=0.2)
+    parser.add_argument("--missing-bundle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    paths = write_cohort(args.out, args.patients, args.abnormal_rate, args.missing_bundle_rate, args.seed)
+    print("Wrote " + " and ".join(paths))
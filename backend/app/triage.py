@@ -0,0 +1,193 @@
+"""
+Persisted triage status: one document per patient in `triage_status`.
+
+    {patient_id, mrn, status: 'critical' | 'normal', alerts, bundle_hash, computed_at}
+
+List/count endpoints read this collection instead of running the pipeline for
+the whole cohort. Writers keep it current: the seeder calls
+`refresh_triage_for_mrns()` for each batch of bundles, ingestion passes the
+docs it computed to `write_triage_docs()`, and app startup runs
+`sync_triage_status()`. `python -m app.triage` rebuilds it from scratch.
+Status changes are pushed to live dashboards through `app.events`.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, ReplaceOne
+
+from . import db
+from .cache import counts, invalidate_bundles
+from .db import patients_collection, triage_collection
+from .events import broadcaster
+from .services import cds_many, mock_cds, ocr_pipeline_many, critical_alerts
+
+BATCH_SIZE = 500
+
+
+async def ensure_triage_indexes():
+    await triage_collection().create_index([("patient_id", ASCENDING)], unique=True)
+    await triage_collection().create_index([("status", ASCENDING), ("patient_id", ASCENDING)])
+
+
+def bundle_hash(bundle):
+    """Stable content hash of a FHIR bundle (key order independent)."""
+    if bundle is None:
+        return None
+    payload = json.dumps(bundle, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def compute_triage_doc(patient: dict, bundle, alerts=None):
+    """
+    Build the triage document for a patient from its (possibly missing) bundle.
+    Pass `alerts` when CDS already ran for this bundle (ingestion workers).
+    """
+    status = "normal"
+    if bundle is None:
+        alerts = []
+    else:
+        if alerts is None:
+            alerts = mock_cds(bundle).get("alerts", []) or []
+        if critical_alerts(alerts):
+            status = "critical"
+    return {
+        "patient_id": patient["patient_id"],
+        "mrn": patient.get("mrn"),
+        "status": status,
+        "alerts": alerts,
+        "bundle_hash": bundle_hash(bundle),
+        "computed_at": datetime.now(timezone.utc),
+    }
+
+
+async def _patient_batches(batch_size: int = BATCH_SIZE):
+    batch = []
+    async for p in patients_collection().find({}, {"_id": 0, "patient_id": 1, "mrn": 1}).sort("patient_id", ASCENDING):
+        batch.append(p)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _batch_bundles(patients):
+    """{patient_id: bundle or None} for a batch, using one batched bundle fetch."""
+    bundles = await ocr_pipeline_many(p["patient_id"] for p in patients)
+    return {
+        pid: None if "error" in bundle else bundle
+        for pid, bundle in bundles.items()
+    }
+
+
+def _docs_for(patients, bundles):
+    """Triage docs for `patients`, running CDS for all their bundles in one vectorized pass."""
+    present = [p for p in patients if bundles[p["patient_id"]] is not None]
+    results = cds_many(bundles[p["patient_id"]] for p in present)
+    alerts = {p["patient_id"]: cds["alerts"] for p, cds in zip(present, results)}
+    return [compute_triage_doc(p, bundles[p["patient_id"]], alerts.get(p["patient_id"])) for p in patients]
+
+
+async def _batch_docs(patients):
+    """Triage docs for a batch of patients."""
+    return _docs_for(patients, await _batch_bundles(patients))
+
+
+async def _current_triage(patient_ids):
+    """{patient_id: {bundle_hash, status}} of the stored docs."""
+    return {
+        d["patient_id"]: d
+        async for d in triage_collection().find(
+            {"patient_id": {"$in": list(patient_ids)}},
+            {"_id": 0, "patient_id": 1, "bundle_hash": 1, "status": 1},
+        )
+    }
+
+
+async def write_triage_docs(docs, current=None):
+    """
+    Store triage docs, writing only those whose bundle hash changed and
+    publishing the ones whose status changed. Returns the written docs.
+    `current` is the stored state when the caller already read it.
+    """
+    if current is None:
+        current = await _current_triage(doc["patient_id"] for doc in docs)
+    changed = [
+        doc for doc in docs
+        if doc["patient_id"] not in current or current[doc["patient_id"]].get("bundle_hash") != doc["bundle_hash"]
+    ]
+    if changed:
+        await triage_collection().bulk_write(
+            [ReplaceOne({"patient_id": d["patient_id"]}, d, upsert=True) for d in changed],
+            ordered=False,
+        )
+        counts.invalidate()
+        invalidate_bundles(*(d["mrn"] for d in changed))
+        for doc in changed:
+            broadcaster.publish_status(doc, current.get(doc["patient_id"], {}).get("status"))
+    return changed
+
+
+async def _sync_batch(patients):
+    """
+    Recompute a batch of patients from their stored bundles. CDS only runs for
+    the patients whose bundle hash differs from the stored doc.
+    """
+    bundles = await _batch_bundles(patients)
+    current = await _current_triage(bundles)
+    stale = [
+        p for p in patients
+        if current.get(p["patient_id"], {}).get("bundle_hash", False) != bundle_hash(bundles[p["patient_id"]])
+    ]
+    if not stale:
+        return 0
+    return len(await write_triage_docs(_docs_for(stale, bundles), current))
+
+
+async def refresh_triage_for_mrns(mrns):
+    """Batched refresh for patients whose bundles were just written."""
+    patients = await patients_collection().find(
+        {"mrn": {"$in": [m for m in mrns if m is not None]}},
+        {"_id": 0, "patient_id": 1, "mrn": 1},
+    ).to_list(None)
+    if not patients:
+        return 0
+    return await _sync_batch(patients)
+
+
+async def sync_triage_status():
+    """Bring the store up to date with every patient; unchanged bundles are skipped."""
+    updated = 0
+    async for patients in _patient_batches():
+        updated += await _sync_batch(patients)
+    return updated
+
+
+async def rebuild_triage_status():
+    """Drop and recompute the whole store (recovery path)."""
+    await triage_collection().drop()
+    await ensure_triage_indexes()
+    count = 0
+    async for patients in _patient_batches():
+        docs = await _batch_docs(patients)
+        await triage_collection().insert_many(docs, ordered=False)
+        count += len(docs)
+    counts.invalidate()
+    invalidate_bundles()
+    broadcaster.resync()
+    return count
+
+
+async def _main():
+    db.connect()
+    try:
+        n = await rebuild_triage_status()
+    finally:
+        await db.close()
+    print(f"Rebuilt triage status for {n} patients")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,209 @@
+"""
+Endpoint benchmark against a synthetic cohort.
+
+Seeds a dedicated database on a local mongod (MONGO_URI, default
+mongodb://localhost:27017/) with app.synthetic cohorts of each requested size,
+then drives the API in-process through the ASGI app (httpx.ASGITransport) and
+reports p50/p95/p99 latency, throughput and Mongo commands per request.
+
+    cd backend
+    pip install -r requirements.txt -r bench/requirements.txt
+    python -m bench.bench_endpoints --sizes 1000,10000 --save-baseline main
+    python -m bench.bench_endpoints --sizes 1000,10000 --compare main
+
+Baselines are JSON files in bench/baselines/.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+from pymongo import monitoring
+
+from app import db
+from app.cache import counts, invalidate_bundles
+from app.main import app
+from app.seed_data import ensure_indexes, seed_fhir, seed_patients
+from app.synthetic import write_cohort
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# name -> path template; {pid} is replaced with a random patient_id per request
+ENDPOINTS = {
+    "critical_count": "/api/critical/count",
+    "critical_patients": "/api/critical/patients?page=1&page_size=10",
+    "normal_patients": "/api/normal/patients?page=1&page_size=10",
+    "patients_overview": "/api/patients/overview?page=1&page_size=10",
+    "patients_overview_deep": "/api/patients/overview?page=50&page_size=10",
+    "patients": "/api/patients?page=1&page_size=10",
+    "pipeline": "/api/pipeline/{pid}",
+    "pipeline_simple": "/api/pipeline/simple/{pid}",
+}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts Mongo commands issued by the client (all threads/tasks)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def seed_cohort(size: int, abnormal_rate: float, seed: int):
+    await db.client.drop_database(db.MONGO_DB)
+    await ensure_indexes()
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, json_path = write_cohort(tmp, size, abnormal_rate, seed=seed)
+        await seed_patients(csv_path)
+        # Triages each batch of bundles as it lands (every bench patient has one)
+        await seed_fhir(json_path)
+
+
+async def bench_endpoint(client, counter, template: str, size: int, requests: int, concurrency: int, rng):
+    # Start cold so cached counts/bundles from a previous endpoint don't leak in
+    counts.invalidate()
+    invalidate_bundles()
+    latencies = []
+    queue = [template.format(pid=rng.randint(1, size)) for _ in range(requests)]
+
+    async def worker():
+        while queue:
+            url = queue.pop()
+            started = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    ops_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": requests / elapsed if elapsed > 0 else 0.0,
+        "mongo_ops_per_request": (counter.count - ops_before) / requests,
+    }
+
+
+def print_table(size: int, results: dict, baseline: dict = None):
+    print(f"\n== cohort {size} ==")
+    header = f"{'endpoint':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'ops/req':>10}"
+    print(header + ("    vs baseline (p50 / p95 / ops)" if baseline else ""))
+    for name, r in results.items():
+        line = (
+            f"{name:<24}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+            f"{r['throughput_rps']:>10.1f}{r['mongo_ops_per_request']:>10.1f}"
+        )
+        base = (baseline or {}).get(name)
+        if base:
+            line += "    " + " / ".join(
+                _delta(r[key], base[key]) for key in ("p50_ms", "p95_ms", "mongo_ops_per_request")
+            )
+        print(line)
+
+
+def _delta(current: float, before: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(current - before) / before * 100:+.0f}%"
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API endpoints on synthetic cohorts.")
+    parser.add_argument("--sizes", default="1000", help="comma-separated cohort sizes, e.g. 1000,10000,100000")
+    parser.add_argument("--abnormal-rate", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of endpoints")
+    parser.add_argument("--db", default="triage_bench", help="database to (re)create for the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    endpoints = {name: ENDPOINTS[name] for name in args.endpoints.split(",")}
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)["results"]
+
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/")
+    db.MONGO_URI = os.environ["MONGO_URI"]
+    db.MONGO_DB = args.db
+    counter = CommandCounter()
+    db.connect(event_listeners=[counter])
+
+    rng = random.Random(args.seed)
+    report = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for size in sizes:
+                print(f"seeding {size} patients into {args.db}...", file=sys.stderr)
+                await seed_cohort(size, args.abnormal_rate, args.seed)
+                results = {}
+                for name, template in endpoints.items():
+                    results[name] = await bench_endpoint(
+                        client, counter, template, size, args.requests, args.concurrency, rng
+                    )
+                report[str(size)] = results
+                print_table(size, results, (baseline or {}).get(str(size)))
+    finally:
+        await db.close()
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump({
+                "meta": {
+                    "revision": _git_revision(),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "abnormal_rate": args.abnormal_rate,
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                },
+                "results": report,
+            }, f, indent=2)
+        print(f"\nSaved baseline to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""
+Test fixtures: the app runs against an in-memory mongomock database through a
+thin async facade that mirrors the parts of pymongo's AsyncMongoClient the app
+uses, and records every command it issues.
+
+    cd backend
+    pip install -r requirements.txt -r tests/requirements.txt
+    python -m pytest -q
+"""
+import asyncio
+
+import mongomock
+import pytest
+from fastapi.testclient import TestClient
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+
+from app import db
+from app.cache import counts, invalidate_bundles
+from app.db import fhir_collection, patients_collection
+from app.synthetic import generate
+from app.triage import sync_triage_status
+
+
+class FakeCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        rows = list(self._cursor)
+        return rows if length is None else rows[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, collection, commands):
+        self._collection = collection
+        self._commands = commands
+        self.name = collection.name
+
+    def _record(self, command):
+        self._commands.append((command, self.name))
+
+    def find(self, *args, **kwargs):
+        self._record("find")
+        kwargs.pop("batch_size", None)
+        return FakeCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        self._record("aggregate")
+        return FakeCursor(iter(list(self._collection.aggregate(pipeline))))
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        self._record("find")
+        if projection and any(isinstance(v, dict) for v in projection.values()):
+            # Expression projections ($filter) aren't supported by find() in mongomock
+            stage = {k: v for k, v in projection.items() if k != "_id"}
+            rows = list(self._collection.aggregate([{"$match": filter or {}}, {"$limit": 1}, {"$project": stage}]))
+            for row in rows:
+                row.pop("_id", None)
+            return rows[0] if rows else None
+        return self._collection.find_one(filter, projection, **kwargs)
+
+    async def find_one_and_update(self, filter, update, projection=None, **kwargs):
+        self._record("findAndModify")
+        doc = self._collection.find_one_and_update(filter, update, **kwargs)
+        if doc is not None and projection and projection.get("_id") == 0:
+            doc.pop("_id", None)
+        return doc
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        self._record("bulkWrite")
+        for op in requests:
+            if isinstance(op, InsertOne):
+                self._collection.insert_one(op._doc)
+            elif isinstance(op, ReplaceOne):
+                self._collection.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, UpdateOne):
+                self._collection.update_one(op._filter, op._doc, upsert=op._upsert)
+            else:
+                raise NotImplementedError(op)
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            self._record(name)
+            kwargs.pop("comment", None)
+            return method(*args, **kwargs)
+
+        return call
+
+
+class FakeDatabase:
+    def __init__(self, database, commands):
+        self._database = database
+        self._commands = commands
+
+    def __getitem__(self, name):
+        return FakeCollection(self._database[name], self._commands)
+
+
+class FakeAsyncMongoClient:
+    def __init__(self):
+        self._client = mongomock.MongoClient()
+        self.commands = []  # (command, collection) in issue order
+
+    def __getitem__(self, name):
+        return FakeDatabase(self._client[name], self.commands)
+
+    async def drop_database(self, name):
+        self._client.drop_database(name)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """A fresh in-memory database installed as the app's shared client."""
+    client = FakeAsyncMongoClient()
+    monkeypatch.setattr(db, "client", client)
+    counts.invalidate()
+    invalidate_bundles()
+    yield client
+    counts.invalidate()
+    invalidate_bundles()
+
+
+@pytest.fixture
+def cohort():
+    """Synthetic patients and bundles, a few of them without a bundle."""
+    pairs = list(generate(60, abnormal_rate=0.3, missing_bundle_rate=0.1, seed=7))
+    return [p for p, _ in pairs], [b for _, b in pairs if b is not None]
+
+
+@pytest.fixture
+def seed(mongo):
+    """seed(patients, bundles, triage=True): store a cohort and, by default, sync its triage docs."""
+
+    def run(patients, bundles, triage=True):
+        async def write():
+            await patients_collection().insert_many([dict(p) for p in patients])
+            await fhir_collection().insert_many([dict(b) for b in bundles if b is not None])
+            if triage:
+                await sync_triage_status()
+
+        asyncio.run(write())
+
+    return run
+
+
+@pytest.fixture
+def seeded_cohort(seed, cohort):
+    """`cohort`, stored with its triage docs."""
+    seed(*cohort)
+    return cohort
+
+
+@pytest.fixture
+def client(mongo):
+    # Not used as a context manager: the lifespan (real Mongo, ingest workers) stays off
+    from app.main import app
+
+    return TestClient(app)
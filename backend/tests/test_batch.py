@@ -0,0 +1,135 @@
+import asyncio
+import copy
+import json
+
+import pytest
+
+from app.batch import cds_chunk, chunks_by_filter
+from app.db import fhir_collection, patients_collection, triage_collection
+
+
+def run_batch(client, payload):
+    response = client.post("/api/pipeline/batch", json=payload)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def stored_status():
+    async def run():
+        return {d["patient_id"]: d["status"] async for d in triage_collection().find({}, {"_id": 0})}
+
+    return asyncio.run(run())
+
+
+def with_bad_bmi(bundle):
+    bundle = copy.deepcopy(bundle)
+    for entry in bundle["entry"]:
+        if entry["resource"].get("code", {}).get("text") == "Body mass index":
+            entry["resource"]["valueQuantity"]["value"] = "31"
+    return bundle
+
+
+def test_unknown_ids_and_missing_bundles_are_inline_error_lines(client, seeded_cohort):
+    patients, bundles = seeded_cohort
+    with_bundle = {b["mrn"] for b in bundles}
+    bundleless = next(p for p in patients if p["mrn"] not in with_bundle)
+    ok = [p for p in patients if p["mrn"] in with_bundle][:3]
+
+    lines = run_batch(client, {"patient_ids": [p["patient_id"] for p in ok] + [bundleless["patient_id"], 99999]})
+
+    by_id = {line["patient_id"]: line for line in lines}
+    assert len(lines) == len(by_id) == 5
+    assert by_id[99999] == {"patient_id": 99999, "error": "No patient found"}
+    assert by_id[bundleless["patient_id"]] == {
+        "patient_id": bundleless["patient_id"], "mrn": bundleless["mrn"], "error": "No bundle found",
+    }
+    status = stored_status()
+    for p in ok:
+        assert by_id[p["patient_id"]]["status"] == status[p["patient_id"]]
+
+
+def test_unknown_mrns_are_inline_error_lines(client, seeded_cohort):
+    patients, _ = seeded_cohort
+    lines = run_batch(client, {"mrns": [patients[0]["mrn"], "MRN-NOPE"]})
+    assert {"mrn": "MRN-NOPE", "error": "No patient found"} in lines
+    assert len(lines) == 2
+
+
+@pytest.mark.parametrize("selector", ["patient_ids", "mrns"])
+def test_duplicate_selectors_are_collapsed(client, seeded_cohort, selector):
+    patients, bundles = seeded_cohort
+    key = "patient_id" if selector == "patient_ids" else "mrn"
+    picked = [p[key] for p in patients[:4]]
+
+    lines = run_batch(client, {selector: picked + picked[::-1] + picked[:1]})
+
+    assert sorted(line[key] for line in lines) == sorted(picked)
+
+
+def test_status_filter_is_served_from_the_triage_store(client, mongo, seeded_cohort):
+    status = stored_status()
+    critical = {pid for pid, s in status.items() if s == "critical"}
+    assert critical
+
+    mongo.commands.clear()
+    lines = run_batch(client, {"filter": {"status": "critical"}})
+
+    assert {line["patient_id"] for line in lines} == critical
+    assert all(line["status"] == "critical" and line["alerts"] for line in lines)
+    assert ("find", patients_collection().name) not in mongo.commands
+
+
+def test_status_and_gender_filter(client, seeded_cohort):
+    patients, _ = seeded_cohort
+    status = stored_status()
+    expected = {p["patient_id"] for p in patients if p["gender"] == "female" and status[p["patient_id"]] == "critical"}
+    assert expected
+
+    lines = run_batch(client, {"filter": {"status": "critical", "gender": "female"}})
+
+    assert {line["patient_id"] for line in lines} == expected
+
+
+def test_filter_pages_through_small_chunks(seeded_cohort):
+    patients, _ = seeded_cohort
+    status = stored_status()
+
+    async def collect():
+        return [[p["patient_id"] for p in chunk] async for chunk, _ in chunks_by_filter("critical", "female", chunk_size=7)]
+
+    chunks = asyncio.run(collect())
+    seen = [pid for chunk in chunks for pid in chunk]
+    assert len(chunks) > 1
+    assert seen == [p["patient_id"] for p in patients if p["gender"] == "female" and status[p["patient_id"]] == "critical"]
+
+
+def test_no_selector_is_rejected(client):
+    response = client.post("/api/pipeline/batch", json={"include_bundle": True})
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Provide patient_ids, mrns or filter"
+
+
+def test_cds_chunk_isolates_a_malformed_bundle(cohort):
+    _, bundles = cohort
+    good = bundles[:3]
+    results = cds_chunk([good[0], with_bad_bmi(good[1]), good[2]])
+
+    assert results[0] == cds_chunk([good[0]])[0]
+    assert results[2] == cds_chunk([good[2]])[0]
+    assert results[1]["error"].startswith("CDS failed: TypeError(")
+
+
+def test_malformed_bundle_fails_only_its_own_line(client, seeded_cohort):
+    patients, bundles = seeded_cohort
+    bad = bundles[0]
+    asyncio.run(fhir_collection().replace_one({"mrn": bad["mrn"]}, with_bad_bmi(bad)))
+    mrns = [b["mrn"] for b in bundles[:5]]
+
+    lines = {line["mrn"]: line for line in run_batch(client, {"mrns": mrns})}
+
+    assert lines[bad["mrn"]]["error"].startswith("CDS failed: ")
+    assert "status" not in lines[bad["mrn"]]
+    status = stored_status()
+    by_mrn = {p["mrn"]: p["patient_id"] for p in patients}
+    for mrn in mrns[1:]:
+        assert lines[mrn]["status"] == status[by_mrn[mrn]]
@@ -0,0 +1,178 @@
+"""The vectorized rule engine must produce exactly the alerts of the original per-entry scan."""
+import asyncio
+
+import pytest
+
+from app.cds_rules import default_rules
+from app.db import triage_collection
+from app.fhir_utils import BundleView
+from app.services import cds_many, mock_cds
+from app.synthetic import generate
+
+
+def legacy_mock_cds(bundle):
+    """mock_cds as it was before cds_rules, kept verbatim as the reference."""
+    alerts = []
+
+    for entry in bundle["entry"]:
+        res = entry["resource"]
+
+        # 🔹 Lab: Lipid panel
+        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Lipid panel":
+            for comp in res.get("component", []):
+                if comp["code"]["text"] == "LDL" and comp["valueQuantity"]["value"] >= 160:
+                    alerts.append("High LDL cholesterol: consider statin")
+                if comp["code"]["text"] == "HDL" and comp["valueQuantity"]["value"] < 40:
+                    alerts.append("Low HDL cholesterol: lifestyle modification advised")
+
+        # 🔹 Vitals: Blood pressure
+        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Blood pressure":
+            systolic = res["component"][0]["valueQuantity"]["value"]
+            diastolic = res["component"][1]["valueQuantity"]["value"]
+            if systolic >= 140 or diastolic >= 90:
+                alerts.append(f"Hypertension detected ({systolic}/{diastolic} mmHg)")
+
+        # 🔹 Vitals: BMI
+        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Body mass index":
+            bmi = res["valueQuantity"]["value"]
+            if bmi >= 30:
+                alerts.append(f"Obesity (BMI {bmi}): recommend weight management")
+            elif bmi < 18.5:
+                alerts.append(f"Underweight (BMI {bmi}): evaluate nutrition")
+
+        # 🔹 Lab: HbA1c
+        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "HbA1c":
+            hba1c = res["valueQuantity"]["value"]
+            if hba1c >= 6.5:
+                alerts.append(f"Diabetes control issue (HbA1c {hba1c}%)")
+
+        # 🔹 Lab: Creatinine (renal function)
+        if res["resourceType"] == "Observation" and res.get("code", {}).get("text") == "Creatinine":
+            cr = res["valueQuantity"]["value"]
+            if cr >= 1.5:
+                alerts.append(f"Elevated creatinine ({cr} mg/dL): check renal function")
+
+        # 🔹 Condition-based alerts
+        if res["resourceType"] == "Condition":
+            cond = res["code"]["text"].lower()
+            if "heart failure" in cond:
+                alerts.append("Heart failure: monitor fluid status")
+            if "copd" in cond:
+                alerts.append("COPD: ensure inhaler adherence")
+            if "hypertension" in cond:
+                alerts.append("Hypertension: consider tighter BP control")
+            if "diabetes" in cond:
+                alerts.append("Diabetes: monitor HbA1c and glucose levels")
+
+    return {"alerts": alerts or ["No critical alerts"]}
+
+
+def _obs(text, value):
+    return {"resource": {"resourceType": "Observation", "code": {"text": text}, "valueQuantity": {"value": value}}}
+
+
+def _panel(text, *parts):
+    return {"resource": {
+        "resourceType": "Observation",
+        "code": {"text": text},
+        "component": [{"code": {"text": name}, "valueQuantity": {"value": value}} for name, value in parts],
+    }}
+
+
+def _condition(text):
+    return {"resource": {"resourceType": "Condition", "code": {"text": text}}}
+
+
+# Thresholds hit exactly, int/float values, repeated and uncoded resources
+EDGE_BUNDLES = [
+    {"entry": []},
+    {"entry": [_obs("Body mass index", 30), _obs("Body mass index", 18.4), _obs("Body mass index", 18.5)]},
+    {"entry": [_obs("HbA1c", 6.5), _obs("HbA1c", 6.4), _obs("Creatinine", 1.5), _obs("Creatinine", 1.49)]},
+    {"entry": [_panel("Blood pressure", ("Systolic", 140), ("Diastolic", 60)),
+               _panel("Blood pressure", ("Systolic", 120), ("Diastolic", 90)),
+               _panel("Blood pressure", ("Systolic", 139), ("Diastolic", 89.5))]},
+    {"entry": [_panel("Lipid panel", ("LDL", 160), ("HDL", 40)), _panel("Lipid panel", ("HDL", 39.9), ("LDL", 159))]},
+    {"entry": [_condition("COPD with Heart Failure, hypertension and type 2 DIABETES"), _condition("Asthma")]},
+    {"entry": [
+        {"resource": {"resourceType": "Patient", "id": "1"}},
+        {"resource": {"resourceType": "Observation", "valueQuantity": {"value": 99}}},
+        {"resource": {"resourceType": "MedicationRequest", "medicationCodeableConcept": {"text": "Metformin"}}},
+        _obs("Body mass index", 31.25), _condition("Diabetes mellitus"), _obs("Body mass index", 17),
+    ]},
+    # Missing and non-numeric values: the reference raises TypeError on these
+    {"entry": [_condition("COPD"), _obs("Body mass index", None)]},
+    {"entry": [_obs("Body mass index", "31")]},
+    {"entry": [_obs("HbA1c", "7.0"), _obs("Creatinine", 1.8)]},
+    {"entry": [_panel("Blood pressure", ("Systolic", None), ("Diastolic", 95))]},
+    {"entry": [_panel("Lipid panel", ("LDL", "170"))]},
+]
+
+
+def outcome(evaluate, *args):
+    """The result, or the exception type, so raising paths can be compared too."""
+    try:
+        return evaluate(*args)
+    except Exception as exc:
+        return type(exc)
+
+
+@pytest.fixture(scope="module")
+def bundles():
+    cohort = [b for rate in (0.0, 0.3, 1.0) for _, b in generate(300, abnormal_rate=rate, seed=11)]
+    return cohort + EDGE_BUNDLES
+
+
+def test_evaluate_matches_legacy(bundles):
+    for bundle in bundles:
+        expected = outcome(legacy_mock_cds, bundle)
+        assert outcome(lambda b: {"alerts": default_rules.evaluate(b) or ["No critical alerts"]}, bundle) == expected
+        assert outcome(mock_cds, bundle) == expected
+
+
+def test_evaluate_view_matches_legacy(bundles):
+    for bundle in bundles:
+        view = BundleView(bundle)
+        expected = outcome(legacy_mock_cds, bundle)
+        assert outcome(lambda v: {"alerts": default_rules.evaluate_view(v) or ["No critical alerts"]}, view) == expected
+        assert outcome(mock_cds, bundle, view) == expected
+
+
+def test_evaluate_many_matches_legacy(bundles):
+    valid = [b for b in bundles if outcome(legacy_mock_cds, b) is not TypeError]
+    assert len(valid) < len(bundles)
+    expected = [legacy_mock_cds(b)["alerts"] for b in valid]
+    assert [alerts or ["No critical alerts"] for alerts in default_rules.evaluate_many(valid)] == expected
+    assert cds_many(valid) == [{"alerts": alerts} for alerts in expected]
+    assert default_rules.evaluate_many([]) == []
+
+    # A bad value fails the batch like it fails the single bundle, instead of
+    # being coerced ("31" -> 31.0 alerts, None -> NaN, no alert)
+    for bundle in bundles:
+        expected = outcome(legacy_mock_cds, bundle)
+        if expected is TypeError:
+            assert outcome(default_rules.evaluate_many, valid + [bundle]) is TypeError
+            assert outcome(cds_many, [bundle]) is TypeError
+
+
+def test_bools_are_not_numbers():
+    bundle = {"entry": [_obs("Body mass index", True)]}
+    assert outcome(default_rules.evaluate, bundle) is TypeError
+    assert outcome(default_rules.evaluate_many, [bundle]) is TypeError
+
+
+def test_triage_sync_matches_legacy(seed):
+    pairs = list(generate(80, abnormal_rate=0.4, missing_bundle_rate=0.1, seed=3))
+    seed([p for p, _ in pairs], [b for _, b in pairs])
+
+    async def run():
+        return {d["patient_id"]: d async for d in triage_collection().find({}, {"_id": 0})}
+
+    stored = asyncio.run(run())
+    for patient, bundle in pairs:
+        doc = stored[patient["patient_id"]]
+        if bundle is None:
+            assert (doc["alerts"], doc["status"]) == ([], "normal")
+        else:
+            alerts = legacy_mock_cds(bundle)["alerts"]
+            assert doc["alerts"] == alerts
+            assert doc["status"] == ("normal" if alerts == ["No critical alerts"] else "critical")
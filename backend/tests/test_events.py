@@ -0,0 +1,42 @@
+import asyncio
+
+from app.db import patients_collection, triage_collection
+from app.events import TriageBroadcaster, _Subscriber
+
+
+def test_recount_resyncs_clients_after_out_of_process_writes(mongo):
+    async def run():
+        await patients_collection().insert_many([{"patient_id": i, "mrn": f"M{i}"} for i in range(1, 6)])
+        await triage_collection().insert_many([
+            {"patient_id": i, "status": "critical" if i == 1 else "normal"} for i in range(1, 6)
+        ])
+        broadcaster = TriageBroadcaster(totals_ttl=0)
+        sub = _Subscriber(8)
+        broadcaster._subscribers.add(sub)
+
+        first = await broadcaster.snapshot()
+        assert (first["total"], first["critical"]) == (5, 1)
+        # Nothing changed: no resync
+        assert await broadcaster.recount() is False
+        assert sub.queue.empty()
+
+        # e.g. `python -m app.triage` in another process
+        await triage_collection().update_one({"patient_id": 2}, {"$set": {"status": "critical"}})
+        assert await broadcaster.recount() is True
+        assert sub.queue.get_nowait() is None
+        second = await broadcaster.snapshot()
+        assert (second["total"], second["critical"], second["normal"]) == (5, 2, 3)
+        assert second["seq"] > first["seq"]
+
+    asyncio.run(run())
+
+
+def test_fresh_totals_are_not_recounted(mongo):
+    async def run():
+        broadcaster = TriageBroadcaster(totals_ttl=3600)
+        await broadcaster.snapshot()
+        await triage_collection().insert_one({"patient_id": 1, "status": "critical"})
+        assert await broadcaster.recount() is False
+        assert (await broadcaster.snapshot())["critical"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,186 @@
+import asyncio
+
+import pytest
+
+from app.db import fhir_collection, ingest_collection, patients_collection, triage_collection
+from app.ingest import claim_batch, get_job, process_batch
+from app.stages import MockLLMStage
+
+PATIENT = {"patient_id": 1, "mrn": "MRN1", "first_name": "Ada", "last_name": "Byron", "gender": "female"}
+BUNDLE = {
+    "resourceType": "Bundle",
+    "type": "collection",
+    "entry": [{"resource": {"resourceType": "Condition", "code": {"text": "COPD"}}}],
+}
+
+
+@pytest.fixture
+def patient(mongo):
+    asyncio.run(patients_collection().insert_one(dict(PATIENT)))
+    return PATIENT
+
+
+def run_worker(stage=None):
+    async def run():
+        jobs = await claim_batch("test-worker")
+        await process_batch(jobs, stage or MockLLMStage(), "test-worker")
+
+    asyncio.run(run())
+
+
+def job_state(job_id):
+    return asyncio.run(get_job(job_id))
+
+
+@pytest.mark.parametrize("bundle", [
+    {"resourceType": "Bundle", "type": "collection"},
+    {"resourceType": "Bundle", "type": "collection", "entry": [{"resource": {"code": {}}}]},
+    {"resourceType": "Bundle", "entry": []},
+])
+def test_malformed_bundles_are_rejected_at_enqueue(client, patient, bundle):
+    response = client.post("/api/ingest", json={"mrn": patient["mrn"], "bundle": bundle})
+    assert response.status_code == 422
+    assert asyncio.run(ingest_collection().count_documents({})) == 0
+
+
+def test_unknown_mrn_is_rejected_at_enqueue(client, patient):
+    response = client.post("/api/ingest", json={"mrn": "NOPE", "bundle": BUNDLE})
+    assert response.status_code == 404
+    response = client.post("/api/ingest", json={"mrn": "NOPE", "document": {"text": "BMI: 31"}})
+    assert response.status_code == 404
+    assert asyncio.run(ingest_collection().count_documents({})) == 0
+
+
+def test_bundle_job_is_processed(client, patient):
+    job = client.post("/api/ingest", json={"mrn": patient["mrn"], "bundle": BUNDLE}).json()
+    run_worker()
+
+    done = job_state(job["job_id"])
+    assert done["status"] == "done"
+    assert done["result"]["patient_id"] == patient["patient_id"]
+    assert done["result"]["status"] == "critical"
+    triage = asyncio.run(triage_collection().find_one({"patient_id": 1}, {"_id": 0}))
+    assert triage["alerts"] == ["COPD: ensure inhaler adherence"]
+
+
+def test_cds_errors_fail_without_retry(client, patient):
+    # Valid bundle shape, but a Blood pressure Observation without components
+    bundle = {**BUNDLE, "entry": [{"resource": {"resourceType": "Observation", "code": {"text": "Blood pressure"}}}]}
+    job = client.post("/api/ingest", json={"mrn": patient["mrn"], "bundle": bundle}).json()
+    run_worker()
+
+    failed = job_state(job["job_id"])
+    assert (failed["status"], failed["attempts"]) == ("failed", 1)
+    assert failed["error"].startswith("CDS failed")
+    assert asyncio.run(fhir_collection().count_documents({})) == 0
+
+
+class FailingStage(MockLLMStage):
+    def __init__(self, exc):
+        super().__init__()
+        self.exc = exc
+
+    async def parse(self, job, patient=None, existing=None):
+        raise self.exc
+
+
+@pytest.mark.parametrize("exc, status", [
+    (ValueError("unreadable document"), "failed"),
+    (KeyError("text"), "failed"),
+    (ConnectionError("model endpoint down"), "queued"),
+])
+def test_only_transient_parse_errors_are_retried(client, patient, exc, status):
+    job = client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": "BMI: 31"}}).json()
+    run_worker(FailingStage(exc))
+    assert job_state(job["job_id"])["status"] == status
+
+
+def test_invalid_stage_output_fails(client, patient):
+    class BadStage(MockLLMStage):
+        async def parse(self, job, patient=None, existing=None):
+            return {"resourceType": "Bundle", "mrn": job["mrn"]}
+
+    job = client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": "BMI: 31"}}).json()
+    run_worker(BadStage())
+    failed = job_state(job["job_id"])
+    assert failed["status"] == "failed"
+    assert failed["error"].startswith("Invalid bundle")
+
+
+def test_patient_removed_after_enqueue(client, patient):
+    job = client.post("/api/ingest", json={"mrn": patient["mrn"], "bundle": BUNDLE}).json()
+    asyncio.run(patients_collection().delete_many({}))
+    run_worker()
+
+    failed = job_state(job["job_id"])
+    assert failed["status"] == "failed"
+    assert asyncio.run(fhir_collection().count_documents({})) == 0
+
+
+def stored_bundle(mrn="MRN1"):
+    return asyncio.run(fhir_collection().find_one({"mrn": mrn}, {"_id": 0}))
+
+
+def resource_types(bundle):
+    return [(e["resource"]["resourceType"], (e["resource"].get("code") or {}).get("text")) for e in bundle["entry"]]
+
+
+def test_documents_merge_into_the_stored_bundle(client, patient):
+    existing = {**BUNDLE, "mrn": patient["mrn"], "entry": [
+        {"resource": {"resourceType": "Patient", "id": "1", "name": [{"given": ["Ada"], "family": "Byron"}]}},
+        {"resource": {"resourceType": "Condition", "code": {"text": "Asthma"}}},
+        {"resource": {"resourceType": "MedicationRequest", "medicationCodeableConcept": {"text": "Albuterol"},
+                      "dosageInstruction": [{"text": "as needed"}]}},
+    ]}
+    asyncio.run(fhir_collection().insert_one(dict(existing)))
+
+    text = "BMI: 31\nCondition: COPD"
+    first = client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": text}}).json()
+    run_worker()
+    assert job_state(first["job_id"])["status"] == "done"
+    assert resource_types(stored_bundle()) == [
+        ("Patient", None), ("Condition", "Asthma"), ("MedicationRequest", None),
+        ("Observation", "Body mass index"), ("Condition", "COPD"),
+    ]
+
+    # Re-sending the same document adds nothing; a new reading is appended
+    client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": text}})
+    client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": "BMI: 27"}})
+    run_worker()
+    bundle = stored_bundle()
+    assert len(bundle["entry"]) == 6
+    assert bundle["entry"][-1]["resource"]["valueQuantity"]["value"] == 27
+    triage = asyncio.run(triage_collection().find_one({"patient_id": 1}, {"_id": 0}))
+    assert triage["alerts"] == ["Obesity (BMI 31): recommend weight management", "COPD: ensure inhaler adherence"]
+
+
+def test_bundle_jobs_replace_the_stored_bundle(client, patient):
+    client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": "BMI: 31"}})
+    run_worker()
+    client.post("/api/ingest", json={"mrn": patient["mrn"], "bundle": BUNDLE})
+    client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": "Condition: Diabetes"}})
+    run_worker()
+
+    # The BMI document is gone; the later document merged into the new bundle
+    assert resource_types(stored_bundle()) == [("Condition", "COPD"), ("Patient", None), ("Condition", "Diabetes")]
+    assert asyncio.run(fhir_collection().count_documents({})) == 1
+
+
+def test_concurrent_merges_both_land(client, patient):
+    asyncio.run(fhir_collection().insert_one({**BUNDLE, "mrn": patient["mrn"]}))
+    client.post("/api/ingest", json={"mrn": patient["mrn"], "document": {"text": "BMI: 31"}})
+
+    async def run():
+        jobs = await claim_batch("worker-a")
+        # Another worker merges a document after this batch read the bundle
+        await fhir_collection().update_one(
+            {"mrn": patient["mrn"]},
+            {"$push": {"entry": {"resource": {"resourceType": "Condition", "code": {"text": "Heart failure"}}}}},
+        )
+        await process_batch(jobs, MockLLMStage(), "worker-a")
+
+    asyncio.run(run())
+    assert ("Condition", "Heart failure") in resource_types(stored_bundle())
+    assert ("Observation", "Body mass index") in resource_types(stored_bundle())
+    triage = asyncio.run(triage_collection().find_one({"patient_id": 1}, {"_id": 0}))
+    assert "Heart failure: monitor fluid status" in triage["alerts"]
@@ -0,0 +1,34 @@
+from app.metrics import REQUEST_SECONDS, STREAM_SECONDS, route_label
+
+
+def series(histogram):
+    return {key for key in histogram._series}
+
+
+def test_route_labels_include_the_router_prefix(client):
+    assert client.get("/api/patient/1").status_code == 200
+    assert client.get("/api/cache/stats").status_code == 200
+    assert client.get("/api/no/such/route").status_code == 404
+
+    labels = {route for _, route, _ in series(REQUEST_SECONDS)}
+    assert {"/api/patient/{patient_id}", "/api/cache/stats", "unmatched"} <= labels
+    assert not {"/patient/{patient_id}", "/cache/stats"} & labels
+    assert 'route="/api/patient/{patient_id}"' in client.get("/metrics").text
+
+
+def test_root_path_is_part_of_the_label():
+    class Route:
+        path = "/cache/stats"
+
+    assert route_label({"route": Route(), "root_path": "/backend"}) == "/backend/cache/stats"
+    assert route_label({"root_path": "/backend"}) == "unmatched"
+
+
+def test_streaming_responses_stay_out_of_request_latency(client):
+    response = client.post("/api/pipeline/batch", json={"patient_ids": []})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    assert ("POST", "/api/pipeline/batch", "200") in series(STREAM_SECONDS)
+    # (a rejected batch, e.g. the 422 in test_batch, is an ordinary response and is timed)
+    assert ("POST", "/api/pipeline/batch", "200") not in series(REQUEST_SECONDS)
@@ -0,0 +1,41 @@
+import pytest
+
+from app.cache import counts
+
+PAGE_SIZES = (1, 10, 50)
+
+
+def commands_for(mongo, client, url):
+    counts.invalidate()
+    mongo.commands.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return list(mongo.commands), response.json()
+
+
+@pytest.mark.parametrize("triage", [True, False], ids=["triage-store", "pipeline-fallback"])
+def test_overview_query_count_is_constant_per_page(mongo, client, cohort, seed, triage):
+    seed(*cohort, triage=triage)
+
+    issued = {}
+    for page_size in PAGE_SIZES:
+        commands, body = commands_for(mongo, client, f"/api/patients/overview?page=1&page_size={page_size}")
+        assert len(body["items"]) == page_size
+        issued[page_size] = commands
+
+    assert issued[1] == issued[10] == issued[50]
+    # count + page + triage lookup (+ one batched bundle fetch when the store is empty)
+    assert len(issued[1]) == (3 if triage else 4)
+
+
+def test_overview_cursor_pages_issue_the_same_queries(mongo, client, seeded_cohort):
+    patients, _ = seeded_cohort
+
+    first, body = commands_for(mongo, client, "/api/patients/overview?page=1&page_size=10")
+    seen = [item["patient"]["patient_id"] for item in body["items"]]
+    while body["next"]:
+        commands, body = commands_for(mongo, client, f"/api/patients/overview?page_size=10&cursor={body['next']}")
+        assert commands == first
+        seen += [item["patient"]["patient_id"] for item in body["items"]]
+
+    assert seen == [p["patient_id"] for p in patients]
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from app.db import triage_collection
+
+
+@pytest.fixture
+def seeded(seeded_cohort):
+    patients, bundles = seeded_cohort
+    with_bundle = {b["mrn"] for b in bundles}
+    return next(p for p in patients if p["mrn"] in with_bundle)
+
+
+def set_alerts(patient_id, alerts):
+    # Another process rewriting the stored alerts for an unchanged bundle
+    asyncio.run(triage_collection().update_one({"patient_id": patient_id}, {"$set": {"alerts": alerts}}))
+
+
+@pytest.mark.parametrize("path, read_alerts", [
+    ("/api/pipeline/{}", lambda body: body["cds"]["alerts"]),
+    ("/api/pipeline/simple/{}", lambda body: body["alerts"]),
+])
+def test_alert_changes_change_the_etag(client, seeded, path, read_alerts):
+    url = path.format(seeded["patient_id"])
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    set_alerts(seeded["patient_id"], ["Reviewed: escalate"])
+    second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["ETag"] != etag
+    assert read_alerts(second.json()) == ["Reviewed: escalate"]
+    assert second.json() != first.json()
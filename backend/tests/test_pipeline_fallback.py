@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from app import routes
+from app.services import mock_cds
+
+
+@pytest.fixture
+def cds_threads(monkeypatch):
+    """Names of the threads the routes' fallback CDS ran on."""
+    threads = []
+
+    def recording(bundles):
+        threads.append(threading.current_thread().name)
+        return cds_chunk(bundles)
+
+    cds_chunk = routes.cds_chunk
+    monkeypatch.setattr(routes, "cds_chunk", recording)
+    return threads
+
+
+@pytest.fixture
+def untriaged(seed, cohort):
+    # Bundles stored without triage docs: every read takes the pipeline fallback
+    patients, bundles = cohort
+    seed(patients, bundles, triage=False)
+    with_bundle = {b["mrn"]: b for b in bundles}
+    return next((p, with_bundle[p["mrn"]]) for p in patients if p["mrn"] in with_bundle)
+
+
+def test_full_pipeline_fallback_runs_cds_on_the_pool(client, untriaged, cds_threads):
+    patient, bundle = untriaged
+    body = client.get(f"/api/pipeline/{patient['patient_id']}").json()
+    assert body["cds"] == mock_cds(bundle)
+    assert cds_threads and all(name.startswith("cds") for name in cds_threads)
+
+
+def test_simple_pipeline_fallback_runs_cds_on_the_pool(client, untriaged, cds_threads):
+    patient, bundle = untriaged
+    body = client.get(f"/api/pipeline/simple/{patient['patient_id']}").json()
+    assert body["alerts"] == mock_cds(bundle)["alerts"]
+    assert cds_threads and all(name.startswith("cds") for name in cds_threads)
+
+
+def test_overview_fallback_runs_cds_on_the_pool(client, untriaged, cds_threads):
+    body = client.get("/api/patients/overview?page_size=20").json()
+    assert len(body["items"]) == 20
+    assert len(cds_threads) == 1 and cds_threads[0].startswith("cds")
+
+
+def test_unknown_patient_fallback(client, mongo, cds_threads):
+    body = client.get("/api/pipeline/424242").json()
+    assert body == {"bundle": {"error": "No patient found"}, "cds": {}}
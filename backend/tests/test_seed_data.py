@@ -0,0 +1,26 @@
+import io
+import json
+
+import pytest
+
+from app.seed_data import iter_json_array
+
+ITEMS = [12, 3.5, -0.25, 1e3, 2.5E-3, "a,]b", True, None, {"x": [1, 2.75]}, [], 1234567]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_items_survive_any_chunk_boundary(chunk_size, indent):
+    text = json.dumps(ITEMS, indent=indent)
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == ITEMS
+
+
+def test_number_split_across_reads():
+    assert list(iter_json_array(io.StringIO("[12, 3.5]"), 1)) == [12, 3.5]
+    assert list(iter_json_array(io.StringIO(" [ ] "), 1)) == []
+
+
+@pytest.mark.parametrize("text", ["[1 2]", "[1,", "{}", "[1.]", "[1, 2"])
+def test_malformed_arrays_raise(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 1))
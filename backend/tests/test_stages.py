@@ -0,0 +1,22 @@
+import pytest
+
+from app.stages import MockLLMStage, ParseStage, load_stage
+
+
+class Incomplete(ParseStage):
+    name = "incomplete"
+
+
+def test_parse_stage_is_abstract():
+    with pytest.raises(TypeError):
+        ParseStage()
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_load_stage():
+    assert isinstance(load_stage("app.stages:MockLLMStage"), MockLLMStage)
+    with pytest.raises(ValueError):
+        load_stage("app.stages")
+    with pytest.raises(TypeError):
+        load_stage("app.models:IngestRequest")
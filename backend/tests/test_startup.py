@@ -0,0 +1,20 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.db import triage_collection
+from app.main import app
+
+
+def test_startup_fills_the_triage_store_of_a_pre_seeded_database(seed, cohort):
+    patients, bundles = cohort
+    # Seeded by an older version: patients and bundles, but no triage_status
+    seed(patients, bundles, triage=False)
+
+    with TestClient(app) as client:
+        overview = client.get("/api/patients/overview?page_size=100").json()
+        critical = sum(item["status"] == "critical" for item in overview["items"])
+        assert critical > 0
+        assert client.get("/api/critical/count").json()["critical_patient_count"] == critical
+        assert client.get("/api/normal/patients").json()["total"] == len(patients) - critical
+        assert asyncio.run(triage_collection().count_documents({})) == len(patients)
@@ -0,0 +1,40 @@
+import asyncio
+
+from app.db import triage_collection
+from app.fhir_utils import BundleView
+from app.routes import SUMMARY_OBSERVATIONS, SUMMARY_RESOURCE_TYPES, summarize
+from app.services import fetch_bundle
+from app.synthetic import generate
+
+
+def test_summary_fetch_only_returns_what_summarize_reads(seed):
+    pairs = list(generate(20, abnormal_rate=0.5, seed=5))
+    seed([p for p, _ in pairs], [b for _, b in pairs], triage=False)
+
+    async def run():
+        return [await fetch_bundle(p["mrn"], SUMMARY_RESOURCE_TYPES, SUMMARY_OBSERVATIONS) for p, _ in pairs]
+
+    for (_, full), narrowed in zip(pairs, asyncio.run(run())):
+        kept = [e["resource"] for e in narrowed["entry"]]
+        for res in kept:
+            assert res["resourceType"] in SUMMARY_RESOURCE_TYPES or res["code"]["text"] in SUMMARY_OBSERVATIONS
+        # Lipid panel, HbA1c and Creatinine are dropped server-side
+        assert len(kept) < len(full["entry"])
+        cds = {"alerts": ["x"]}
+        assert summarize(BundleView(narrowed), cds) == summarize(BundleView(full), cds)
+
+
+def test_simple_endpoint_serves_stored_alerts(client, seeded_cohort):
+    patients, bundles = seeded_cohort
+
+    async def run():
+        return {d["patient_id"]: d["alerts"] async for d in triage_collection().find({}, {"_id": 0})}
+
+    stored = asyncio.run(run())
+    with_bundle = {b["mrn"] for b in bundles}
+    for p in patients[:20]:
+        body = client.get(f"/api/pipeline/simple/{p['patient_id']}").json()
+        if p["mrn"] in with_bundle:
+            assert body["alerts"] == stored[p["patient_id"]]
+        else:
+            assert body == {"error": "No bundle found"}
@@ -1,16 +1,26 @@
 const API_URL = "http://localhost:8000/api";
 
 /* ---------- PAGINATION STATE ---------- */
+// Each pager keeps the cursor that produced its current page, so re-showing a
+// tab reloads the same page by keyset instead of skip.
 let critPage = 1;
+let critCursor = null;
 const critPageSize = 5;
 
 let allPage = 1;
+let allCursor = null;
 const allPageSize = 10;
 
 let normalPage = 1;
+let normalCursor = null;
 const normalPageSize = 10;
 
-function renderPager(el, { page, pageSize, total }, onChange) {
+function pageUrl(path, page, pageSize, cursor) {
+  const url = `${API_URL}${path}?page=${page}&page_size=${pageSize}`;
+  return cursor ? `${url}&cursor=${encodeURIComponent(cursor)}` : url;
+}
+
+function renderPager(el, { page, pageSize, total, next, prev }, onChange) {
   if (!el) return;
   const totalPages = Math.max(1, Math.ceil(total / pageSize));
   const start = total === 0 ? 0 : (page - 1) * pageSize + 1;
@@ -25,10 +35,11 @@ function renderPager(el, { page, pageSize, total }, onChange) {
     </div>
   `;
 
-  const prev = el.querySelector("#pgPrev");
-  const next = el.querySelector("#pgNext");
-  if (prev) prev.onclick = () => onChange(Math.max(1, page - 1));
-  if (next) next.onclick = () => onChange(Math.min(totalPages, page + 1));
+  // Prefer the server's keyset cursors; fall back to page numbers
+  const prevBtn = el.querySelector("#pgPrev");
+  const nextBtn = el.querySelector("#pgNext");
+  if (prevBtn) prevBtn.onclick = () => onChange(Math.max(1, page - 1), prev || null);
+  if (nextBtn) nextBtn.onclick = () => onChange(Math.min(totalPages, page + 1), next || null);
 }
 
 /* ---------- HELPERS ---------- */
@@ -109,28 +120,29 @@ function wireNavModeLinks(id) {
 
 /* ---------- DASHBOARD ---------- */
 
-async function loadDashboard() {
-  const [countRes, critCountRes] = await Promise.all([
-    fetch(`${API_URL}/patients/count`),
-    fetch(`${API_URL}/critical/count`)
-  ]);
-  const { total } = await countRes.json();
-  const { critical_patient_count } = await critCountRes.json();
-  const normalCount = total - critical_patient_count;
-
-  // Update count displays
-  document.getElementById("criticalCount").textContent = critical_patient_count;
+let patientsChart = null;
+const triageTotals = { total: 0, critical: 0 };
+
+function renderTotals() {
+  const normalCount = triageTotals.total - triageTotals.critical;
+  document.getElementById("criticalCount").textContent = triageTotals.critical;
   document.getElementById("normalCount").textContent = normalCount;
+  if (patientsChart) {
+    patientsChart.data.datasets[0].data = [triageTotals.critical, normalCount];
+    patientsChart.update();
+  }
+}
 
-  // Pie chart
+async function loadDashboard() {
+  // Pie chart; the live stream fills in the numbers
   const ctx = document.getElementById("patientsChart")?.getContext("2d");
   if (ctx) {
-    new Chart(ctx, {
+    patientsChart = new Chart(ctx, {
       type: "doughnut",
       data: {
         labels: ["Critical", "Normal"],
         datasets: [{
-          data: [critical_patient_count, normalCount],
+          data: [0, 0],
           backgroundColor: ["#dc3545", "#28a745"],
           borderWidth: 0
         }]
@@ -148,33 +160,87 @@ async function loadDashboard() {
     });
   }
 
+  connectTriageStream();
+
   // Load initial critical patients data
-  await loadCriticalPatientsPage(critPage);
+  await loadCriticalPatientsPage(critPage, critCursor);
+}
+
+/* ---------- LIVE UPDATES ---------- */
+
+// Totals arrive as a snapshot on connect, then as per-patient status deltas.
+// EventSource reconnects by itself and sends Last-Event-ID, so the server
+// replays what we missed (or sends a new snapshot).
+function connectTriageStream() {
+  const source = new EventSource(`${API_URL}/triage/stream`);
+
+  source.addEventListener("snapshot", (e) => {
+    const snap = JSON.parse(e.data);
+    triageTotals.total = snap.total;
+    triageTotals.critical = snap.critical;
+    renderTotals();
+  });
+
+  source.addEventListener("status", (e) => {
+    const change = JSON.parse(e.data);
+    triageTotals.critical +=
+      (change.status === "critical" ? 1 : 0) - (change.previous === "critical" ? 1 : 0);
+    renderTotals();
+    applyStatusChange(change);
+  });
+
+  return source;
+}
+
+// Patch rows already on screen instead of refetching the lists
+function applyStatusChange({ patient_id, status, alerts }) {
+  const isCritical = status === "critical";
+
+  document.querySelectorAll(`#allPatientsTableBody tr[data-patient-id="${patient_id}"] .status-cell`)
+    .forEach(cell => { cell.innerHTML = statusBadge(isCritical); });
+
+  document.querySelectorAll(`#criticalPatientsTableBody tr[data-patient-id="${patient_id}"]`)
+    .forEach(row => {
+      if (!isCritical) row.remove();
+      else row.querySelector(".alerts-cell").innerHTML = `<div class="d-flex flex-wrap">${renderAlertBadges(alerts)}</div>`;
+    });
+
+  if (isCritical) {
+    document.querySelectorAll(`#normalPatientsTableBody tr[data-patient-id="${patient_id}"]`)
+      .forEach(row => row.remove());
+  }
+}
+
+function statusBadge(isCritical) {
+  return isCritical
+    ? '<span class="badge bg-danger">Critical</span>'
+    : '<span class="badge bg-success">Normal</span>';
 }
 
 /* ---------- TAB FUNCTIONS ---------- */
 
 async function showAllPatientsTab() {
-  await loadAllPatientsPage(allPage);
+  await loadAllPatientsPage(allPage, allCursor);
 }
 
 async function showCriticalPatientsTab() {
-  await loadCriticalPatientsPage(critPage);
+  await loadCriticalPatientsPage(critPage, critCursor);
 }
 
 async function showNormalPatientsTab() {
-  await loadNormalPatientsPage(normalPage);
+  await loadNormalPatientsPage(normalPage, normalCursor);
 }
 
 /* ---------- CRITICAL PATIENTS ---------- */
 
-async function loadCriticalPatientsPage(page) {
+async function loadCriticalPatientsPage(page, cursor = null) {
   critPage = page;
+  critCursor = cursor;
   const tableBody = document.getElementById("criticalPatientsTableBody");
   const pagerEl = document.getElementById("criticalPatientsPager");
   if (!tableBody || !pagerEl) return;
 
-  const res = await fetch(`${API_URL}/critical/patients?page=${critPage}&page_size=${critPageSize}`);
+  const res = await fetch(pageUrl("/critical/patients", critPage, critPageSize, critCursor));
   const data = await res.json();
 
   tableBody.innerHTML = "";
@@ -182,12 +248,13 @@ async function loadCriticalPatientsPage(page) {
     const alertsBlock = renderAlertBadges(cp.alerts);
 
     const row = document.createElement("tr");
+    row.dataset.patientId = cp.patient.patient_id;
     row.innerHTML = `
       <td class="fw-semibold">${cp.patient.mrn}</td>
       <td>${cp.patient.first_name} ${cp.patient.last_name}</td>
       <td>${cp.patient.age}</td>
       <td>${cp.patient.gender}</td>
-      <td style="max-width:400px;">
+      <td class="alerts-cell" style="max-width:400px;">
         <div class="d-flex flex-wrap">${alertsBlock}</div>
       </td>
       <td>
@@ -199,36 +266,33 @@ async function loadCriticalPatientsPage(page) {
     tableBody.appendChild(row);
   });
 
-  renderPager(pagerEl, { page: data.page, pageSize: data.page_size, total: data.total }, (newPage) => {
-    loadCriticalPatientsPage(newPage);
+  renderPager(pagerEl, { page: data.page, pageSize: data.page_size, total: data.total, next: data.next, prev: data.prev }, (newPage, cursor) => {
+    loadCriticalPatientsPage(newPage, cursor);
   });
 }
 
 /* ---------- ALL PATIENTS TAB ---------- */
-async function loadAllPatientsPage(page) {
+async function loadAllPatientsPage(page, cursor = null) {
   allPage = page;
+  allCursor = cursor;
   const tableBody = document.getElementById("allPatientsTableBody");
   const pagerEl = document.getElementById("allPatientsPager");
   if (!tableBody || !pagerEl) return;
 
-  const res = await fetch(`${API_URL}/patients/overview?page=${allPage}&page_size=${allPageSize}`);
+  const res = await fetch(pageUrl("/patients/overview", allPage, allPageSize, allCursor));
   const data = await res.json();
 
   tableBody.innerHTML = "";
   data.items.forEach(item => {
     const p = item.patient;
-    const isCritical = item.status === "critical";
-    const statusBadge = isCritical
-      ? '<span class="badge bg-danger">Critical</span>'
-      : '<span class="badge bg-success">Normal</span>';
-
     const row = document.createElement("tr");
+    row.dataset.patientId = p.patient_id;
     row.innerHTML = `
       <td class="fw-semibold">${p.mrn}</td>
       <td>${p.first_name} ${p.last_name}</td>
       <td>${p.age}</td>
       <td>${p.gender}</td>
-      <td>${statusBadge}</td>
+      <td class="status-cell">${statusBadge(item.status === "critical")}</td>
       <td>
         <button class="btn view-summary-btn btn-sm" onclick="viewPatientSummary(${p.patient_id})">
           View summary
@@ -240,26 +304,28 @@ async function loadAllPatientsPage(page) {
 
   renderPager(
     pagerEl,
-    { page: data.page, pageSize: data.page_size, total: data.total },
-    (newPage) => loadAllPatientsPage(newPage)
+    { page: data.page, pageSize: data.page_size, total: data.total, next: data.next, prev: data.prev },
+    (newPage, cursor) => loadAllPatientsPage(newPage, cursor)
   );
 }
 
 
 /* ---------- NORMAL PATIENTS TAB ---------- */
-async function loadNormalPatientsPage(page) {
+async function loadNormalPatientsPage(page, cursor = null) {
   normalPage = page;
+  normalCursor = cursor;
   const tableBody = document.getElementById("normalPatientsTableBody");
   const pagerEl = document.getElementById("normalPatientsPager");
   if (!tableBody || !pagerEl) return;
 
-  const res = await fetch(`${API_URL}/normal/patients?page=${normalPage}&page_size=${normalPageSize}`);
+  const res = await fetch(pageUrl("/normal/patients", normalPage, normalPageSize, normalCursor));
   const data = await res.json();
 
   tableBody.innerHTML = "";
   data.items.forEach(item => {
     const p = item.patient;
     const row = document.createElement("tr");
+    row.dataset.patientId = p.patient_id;
     row.innerHTML = `
       <td class="fw-semibold">${p.mrn}</td>
       <td>${p.first_name} ${p.last_name}</td>
@@ -277,8 +343,8 @@ async function loadNormalPatientsPage(page) {
 
   renderPager(
     pagerEl,
-    { page: data.page, pageSize: data.page_size, total: data.total },
-    (newPage) => loadNormalPatientsPage(newPage)
+    { page: data.page, pageSize: data.page_size, total: data.total, next: data.next, prev: data.prev },
+    (newPage, cursor) => loadNormalPatientsPage(newPage, cursor)
   );
 }
 